@@ -0,0 +1,58 @@
+import sys
+import json
+import argparse
+
+
+
+"""Compares the stages of two benchmark results saved by run_benchmarks.py.
+
+    Args:
+        (dict) baseline: first result
+        (dict) current: second result
+        (float) threshold: ratio of wall times above which a stage is reported as a regression
+
+    Returns:
+        (list) rows: tuples (stage,baseline wall time,current wall time,ratio,regression) for the stages of both results
+        (bool) regression: indicates whether or not a stage regressed
+
+"""
+def compare_results(baseline,current,threshold):
+    baseline_times = {stage['name']:stage['wall_time'] for stage in baseline['stages']}
+    rows = []
+    for stage in current['stages']:
+        if stage['name'] not in baseline_times:
+            continue
+        before = baseline_times[stage['name']]
+        ratio = stage['wall_time'] / before if before > 0 else float('inf')
+        rows.append((stage['name'],before,stage['wall_time'],ratio,ratio > threshold))
+    return rows,any(row[4] for row in rows)
+
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('baseline', type=str)
+    parser.add_argument('current', type=str)
+    parser.add_argument('--threshold', nargs="?", type=float, default=1.2)
+    args = parser.parse_args()
+
+    with open(args.baseline,'r') as f:
+        baseline = json.load(f)
+    with open(args.current,'r') as f:
+        current = json.load(f)
+
+    for name,result in (('baseline',baseline),('current',current)):
+        metadata = result['metadata']
+        print(name,':',metadata.get('commit'),metadata.get('date'),metadata.get('nb_articles'),'articles')
+    if baseline['metadata'].get('nb_articles') != current['metadata'].get('nb_articles'):
+        print('Warning: the results were measured on different corpora')
+
+    rows,regression = compare_results(baseline,current,args.threshold)
+    print('%-40s %10s %10s %7s' % ('stage','baseline','current','ratio'))
+    for name,before,after,ratio,regressed in rows:
+        print('%-40s %9.3fs %9.3fs %6.2fx%s' % (name,before,after,ratio,' <- regression' if regressed else ''))
+    sys.exit(1 if regression else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import os
+import sys
+import time
+import random
+import shutil
+import platform
+import argparse
+import subprocess
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import build_wikIR
+import profiling
+from synthetic_corpus import generate_corpus,parse_scale
+
+
+
+"""Directory of the benchmarks, default directories are created inside it whatever the current directory"""
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+
+"""Returns the commit of the repository and whether or not the working tree has uncommitted changes.
+
+    Returns:
+        (dict) commit: keys are 'commit' (None if git is not available) and 'dirty'
+
+"""
+def git_commit():
+    root = os.path.dirname(BENCHMARKS_DIR)
+    try:
+        commit = subprocess.run(['git','rev-parse','HEAD'],cwd=root,capture_output=True,text=True,check=True).stdout.strip()
+        status = subprocess.run(['git','status','--porcelain','--untracked-files=no'],cwd=root,capture_output=True,text=True,check=True).stdout
+    except (OSError,subprocess.CalledProcessError):
+        return {'commit':None,'dirty':None}
+    return {'commit':commit,'dirty':bool(status.strip())}
+
+
+
+"""Returns the synthetic corpus of a scale, generated the first time it is used.
+
+    Args:
+        (str) work_dir: directory where the corpora are generated
+        (int) nb_articles: number of articles
+        (int) seed: seed of the generator
+
+    Returns:
+        (str) file: path of the corpus
+
+"""
+def get_corpus(work_dir,nb_articles,seed):
+    file = os.path.join(work_dir,'synthetic.%d.%d.json' % (nb_articles,seed))
+    if not os.path.exists(file):
+        print('Generating',nb_articles,'articles in',file,flush=True)
+        generate_corpus(file + '.tmp',nb_articles,seed)
+        os.replace(file + '.tmp',file)
+    return file
+
+
+
+"""Builds a collection from a corpus like build_wikIR.py, runs BM25 on the validation and test queries and evaluates the runs,
+    timing each function with a profiling.Profiler.
+
+    Args:
+        (str) file: path of the corpus
+        (str) output_dir: directory of the collection (deleted first)
+        (argparse.Namespace) args: arguments of the benchmark
+
+    Returns:
+        (profiling.Profiler) profiler: profiles of the stages
+
+"""
+def benchmark_corpus(file,output_dir,args):
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    for name in ('training','validation','test'):
+        os.makedirs(output_dir + '/' + name)
+
+    profiler = profiling.Profiler(True,args.profile_dir,args.trace_memory)
+    random.seed(args.random_seed)
+
+    with profiler.stage('read_wikiextractor'):
+        documents,documents_ids = build_wikIR.read_wikiextractor(file,args.min_len_doc,None)
+        profiling.add_items(docs=len(documents))
+    with profiler.stage('build_qrels',docs=len(documents)):
+        qrels = build_wikIR.build_qrels(documents,documents_ids,args.len_doc,args.min_nb_rel_doc,False)
+        profiling.add_items(queries=len(qrels))
+    with profiler.stage('clean_docs_and_build_queries',docs=len(documents)):
+        documents,queries = build_wikIR.clean_docs_and_build_queries(qrels,documents,args.len_doc,args.len_query,False,False,True,'en')
+    with profiler.stage('delete_empty',docs=len(documents),queries=len(queries)):
+        documents,queries,qrels = build_wikIR.delete_empty(documents,queries,qrels)
+    with profiler.stage('build_train_validation_test',queries=len(queries)):
+        train,validation,test = build_wikIR.build_train_validation_test(queries,args.validation_part,args.test_part)
+
+    with profiler.stage('save_all_qrel',queries=len(queries)):
+        build_wikIR.save_all_qrel(output_dir,qrels,train,validation,test)
+    for function in (build_wikIR.save_csv,build_wikIR.save_json,build_wikIR.save_xml):
+        with profiler.stage(function.__name__,docs=len(documents),queries=len(queries)):
+            function(output_dir,documents,queries,train,validation,test)
+    with profiler.stage('save_columnar',docs=len(documents),queries=len(queries)):
+        build_wikIR.save_columnar(output_dir,documents,queries,qrels,train,validation,test)
+
+    with profiler.stage('indexing',docs=len(documents)):
+        bm25 = build_wikIR.load_or_build_BM25_index(output_dir,documents,'en')
+    doc_indexes = bm25.doc_indexes.tolist()
+    for name,subset in (('validation',validation),('test',test)):
+        with profiler.stage('retrieval.' + name,queries=len(subset)):
+            results = build_wikIR.run_BM25_queries(subset,queries,bm25,doc_indexes,args.k,'en',pruning=args.pruning,batch_size=args.batch_size)
+        with profiler.stage('save_BM25_res.' + name,queries=len(results)):
+            build_wikIR.save_BM25_res(output_dir + '/' + name + '/BM25.res',results)
+        with profiler.stage('evaluate.' + name,queries=len(results)):
+            build_wikIR.evaluate(output_dir + '/' + name + '/BM25.metrics.json',
+                                 output_dir + '/' + name + '/qrels',
+                                 output_dir + '/' + name + '/BM25.res')
+    return profiler
+
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s','--scales', nargs="+", type=str, default=['10k'])
+    parser.add_argument('-w','--work_dir', nargs="?", type=str, default=os.path.join(BENCHMARKS_DIR,'work'))
+    parser.add_argument('-o','--results_dir', nargs="?", type=str, default=os.path.join(BENCHMARKS_DIR,'results'))
+    parser.add_argument('--seed', nargs="?", type=int, default=0)
+    parser.add_argument('-r','--random_seed', nargs="?", type=int, default=27355)
+    parser.add_argument('-d','--len_doc', nargs="?", type=int, default=200)
+    parser.add_argument('-q','--len_query', nargs="?", type=int, default=10)
+    parser.add_argument('-l','--min_len_doc', nargs="?", type=int, default=200)
+    parser.add_argument('-e','--min_nb_rel_doc', nargs="?", type=int, default=5)
+    parser.add_argument('-v','--validation_part', nargs="?", type=int, default=1000)
+    parser.add_argument('-t','--test_part', nargs="?", type=int, default=1000)
+    parser.add_argument('-k','--k', nargs="?", type=int, default=100)
+    parser.add_argument('--pruning', action="store_true")
+    parser.add_argument('--batch_size', nargs="?", type=int, default=None)
+    parser.add_argument('--profile_dir', nargs="?", type=str, default=None)
+    parser.add_argument('--trace_memory', action="store_true")
+    parser.add_argument('--keep_outputs', action="store_true")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.results_dir):
+        os.makedirs(args.results_dir)
+    if not os.path.exists(args.work_dir):
+        os.makedirs(args.work_dir)
+
+    metadata = {'date':time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python':platform.python_version(),
+                'platform':platform.platform(),
+                'processor':platform.processor(),
+                'cpu_count':os.cpu_count(),
+                **git_commit()}
+
+    for scale in args.scales:
+        nb_articles = parse_scale(scale)
+        file = get_corpus(args.work_dir,nb_articles,args.seed)
+        output_dir = os.path.join(args.work_dir,'collection.%d' % nb_articles)
+        print('Benchmarking',nb_articles,'articles',flush=True)
+        profiler = benchmark_corpus(file,output_dir,args)
+
+        path = os.path.join(args.results_dir,'%s.%s.json' % (scale,time.strftime('%Y%m%d-%H%M%S')))
+        profiler.save(path,{**metadata,'scale':scale,'nb_articles':nb_articles,'corpus_size':os.path.getsize(file),**vars(args)})
+        print('Results saved in',path,flush=True)
+        if not args.keep_outputs:
+            shutil.rmtree(output_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import os
+import json
+import argparse
+import numpy as np
+from urllib.parse import quote
+
+
+
+"""Most frequent english words, they are the most frequent words of the synthetic vocabulary"""
+FUNCTION_WORDS = ['the','of','and','in','to','a','was','is','for','as','on','by','with','he','that','at','from','his','it','an',
+                  'were','are','which','this','also','be','or','has','had','first','its','after','their','but','not','her',
+                  'who','they','new','one','two','been','she','other','more','during','all','into','there','where']
+
+"""Syllables used to build the synthetic words"""
+SYLLABLES = ['ka','to','ri','me','su','no','la','pe','di','vo','ga','shi','ne','ru','bo','fa','te','mi','zu','lo',
+             'ar','en','ol','is','um','ver','tan','dor','sel','kri','mon','bal','cor','lin','fer','gar','pol','ston']
+
+
+
+"""Parses a number of articles written with an optional k (thousands) or M (millions) suffix, e.g. 10k or 1M.
+
+    Args:
+        (str) scale: number of articles
+
+    Returns:
+        (int) nb_articles: number of articles
+
+"""
+def parse_scale(scale):
+    multipliers = {'k':10**3,'K':10**3,'m':10**6,'M':10**6}
+    if scale[-1] in multipliers:
+        return int(float(scale[:-1]) * multipliers[scale[-1]])
+    return int(scale)
+
+
+
+"""Builds a synthetic word from its rank: distinct ranks give distinct words.
+
+    Args:
+        (int) rank: rank of the word
+
+    Returns:
+        (str) word: the word
+
+"""
+def synthetic_word(rank):
+    syllables = [SYLLABLES[rank % len(SYLLABLES)]]
+    rank //= len(SYLLABLES)
+    while rank:
+        rank -= 1
+        syllables.append(SYLLABLES[rank % len(SYLLABLES)])
+        rank //= len(SYLLABLES)
+    return ''.join(syllables)
+
+
+
+"""Returns the cumulative distribution of a Zipf law over n ranks: the probability of the rank r is proportional to 1/r^exponent.
+
+    Args:
+        (int) n: number of ranks
+        (float) exponent: exponent of the law
+
+    Returns:
+        (numpy.ndarray) cdf: cumulative probabilities of the ranks
+
+"""
+def zipf_cdf(n,exponent):
+    cdf = np.cumsum(1 / np.arange(1,n + 1,dtype=np.float64)**exponent)
+    return cdf / cdf[-1]
+
+
+
+"""Generates a synthetic file in the format produced by wikiextractor (--json --links): one json article per line
+    with a title and a text made of the title followed by sentences.
+
+    Words follow a Zipf law over a vocabulary whose most frequent words are english function words, so that stopword
+    removal and stemming do the same kind of work as on a real dump. Article lengths follow a log-normal law
+    (median median_len words). Links point to other articles with a Zipf law over a random order of the articles,
+    which gives a few very linked articles like on Wikipedia. A part of the links point to missing articles,
+    use a lower case first letter or an anchor, like the links of a real dump.
+
+    Args:
+        (str) file: path of the generated file
+        (int) nb_articles: number of articles
+        (int) seed: seed of the random generator
+        (int) vocabulary_size: number of distinct words
+        (float) word_exponent: exponent of the Zipf law of the words
+        (float) link_exponent: exponent of the Zipf law of the link targets
+        (int) median_len: median number of words per article
+        (float) sigma_len: standard deviation of the logarithm of the number of words per article
+        (float) link_rate: probability of a word to be a link
+        (float) sentence_rate: probability of a word to end a sentence
+        (float) missing_rate: part of the links pointing to missing articles
+        (int) block_size: number of articles generated at once
+
+"""
+def generate_corpus(file,nb_articles,seed=0,vocabulary_size=200000,word_exponent=1.07,link_exponent=0.8,median_len=300,sigma_len=0.9,
+                    link_rate=0.04,sentence_rate=0.05,missing_rate=0.08,block_size=1000):
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(FUNCTION_WORDS + [synthetic_word(rank) for rank in range(vocabulary_size - len(FUNCTION_WORDS))],dtype=object)
+    word_cdf = zipf_cdf(vocabulary_size,word_exponent)
+    link_cdf = zipf_cdf(nb_articles,link_exponent)
+    popularity = rng.permutation(nb_articles)
+
+    title_words = rng.integers(len(FUNCTION_WORDS),vocabulary_size,size=nb_articles)
+    titles = [vocabulary[word].capitalize() + ' ' + synthetic_word(i).capitalize() for i,word in enumerate(title_words.tolist())]
+
+    with open(file,'w',encoding='utf-8') as f:
+        for start in range(0,nb_articles,block_size):
+            end = min(start + block_size,nb_articles)
+            lengths = np.clip(rng.lognormal(np.log(median_len),sigma_len,size=end - start),10,20000).astype(np.int64)
+            words = vocabulary[np.searchsorted(word_cdf,rng.random(lengths.sum()))]
+            is_link = rng.random(len(words)) < link_rate
+            is_end = rng.random(len(words)) < sentence_rate
+
+            nb_links = int(is_link.sum())
+            targets = popularity[np.minimum(np.searchsorted(link_cdf,rng.random(nb_links)),nb_articles - 1)]
+            kinds = rng.random(nb_links)
+            links = []
+            for target,kind in zip(targets.tolist(),kinds.tolist()):
+                title = titles[target]
+                if kind < missing_rate:
+                    title = title + ' ' + synthetic_word(target)
+                elif kind < missing_rate + 0.1:
+                    title = title[0].lower() + title[1:]
+                elif kind < missing_rate + 0.15:
+                    title = title + '#' + synthetic_word(target % 1000).capitalize()
+                links.append('<a href="%s">%s</a>' % (quote(title),titles[target]))
+            words[is_link] = links
+            words[is_end] = words[is_end] + '.'
+
+            boundaries = np.concatenate([[0],np.cumsum(lengths)]).tolist()
+            for i in range(end - start):
+                title = titles[start + i]
+                text = title + '\n\n' + ' '.join(words[boundaries[i]:boundaries[i+1]].tolist()) + '.'
+                f.write(json.dumps({'id':str(start + i),'url':'','title':title,'text':text}) + '\n')
+
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o','--output', nargs="?", type=str)
+    parser.add_argument('-n','--nb_articles', nargs="?", type=str, default='10k')
+    parser.add_argument('--seed', nargs="?", type=int, default=0)
+    parser.add_argument('--vocabulary_size', nargs="?", type=int, default=200000)
+    parser.add_argument('--median_len', nargs="?", type=int, default=300)
+    args = parser.parse_args()
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    generate_corpus(args.output,parse_scale(args.nb_articles),args.seed,args.vocabulary_size,median_len=args.median_len)
+
+if __name__ == "__main__":
+    main()
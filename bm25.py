@@ -0,0 +1,460 @@
+import os
+import math
+import json
+import numpy as np
+import scipy.sparse
+from array import array
+from collections import Counter
+
+
+
+"""Okapi BM25 ranking model backed by an inverted index.
+
+    The postings are stored CSR-style in flat numpy arrays: the postings of the term
+    whose id is t are doc_ids[indptr[t]:indptr[t+1]] with term frequencies tfs[indptr[t]:indptr[t+1]].
+    IDF values and document length norms are precomputed when the index is built, so that
+    scoring a query only visits the postings of its terms.
+    Scores are computed with the same formula and the same floating point operations as
+    rank_bm25.BM25Okapi, rankings are therefore identical.
+
+    Args:
+        (iterable) corpus: iterable of tokenized documents (lists of str)
+        (float) k1: BM25 k1 parameter
+        (float) b: BM25 b parameter
+        (float) epsilon: floor applied to negative idf values, as a fraction of the average idf
+        (list) doc_indexes: ids of the documents of the corpus (if None: positions in the corpus)
+
+"""
+class BM25Index:
+
+    arrays = ['doc_ids','tfs','indptr','doc_len','idf','norms','max_scores','doc_indexes']
+
+    def __init__(self,corpus,k1=1.5,b=0.75,epsilon=0.25,doc_indexes=None):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.vocabulary = dict()
+
+        term_ids = array('i')
+        tfs = array('i')
+        nb_terms = array('i')
+        doc_len = array('q')
+        for document in corpus:
+            frequencies = Counter(document)
+            for term,tf in frequencies.items():
+                term_ids.append(self.vocabulary.setdefault(term,len(self.vocabulary)))
+                tfs.append(tf)
+            nb_terms.append(len(frequencies))
+            doc_len.append(len(document))
+
+        self.corpus_size = len(doc_len)
+        self.doc_len = np.frombuffer(doc_len,dtype=np.int64)
+        self.avgdl = int(self.doc_len.sum()) / self.corpus_size
+
+        term_ids = np.frombuffer(term_ids,dtype=np.int32)
+        order = np.argsort(term_ids,kind='stable')
+        self.doc_ids = np.repeat(np.arange(self.corpus_size,dtype=np.int32),
+                                 np.frombuffer(nb_terms,dtype=np.int32))[order]
+        self.tfs = np.frombuffer(tfs,dtype=np.int32)[order]
+
+        df = np.bincount(term_ids,minlength=len(self.vocabulary))
+        self.indptr = np.zeros(len(self.vocabulary) + 1,dtype=np.int64)
+        np.cumsum(df,out=self.indptr[1:])
+
+        self.idf = self._compute_idf(df)
+        self.norms = self.k1 * (1 - self.b + self.b * self.doc_len / self.avgdl)
+        self.max_scores = self._compute_max_scores()
+        if doc_indexes is None:
+            doc_indexes = range(self.corpus_size)
+        self.doc_indexes = np.asarray(doc_indexes,dtype=np.int64)
+        self.metadata = dict()
+
+
+
+    """Saves the index in a directory: one .npy file per array, the vocabulary and the parameters in json.
+
+        The files are written under temporary names and renamed once they are all written. params.json is
+        removed first and renamed last, so an interrupted save leaves no index that read_metadata or load accept.
+
+        Args:
+            (str) path: path of the directory
+            (dict) metadata: information saved with the index (e.g. the analysis used to build it)
+
+    """
+    def save(self,path,metadata=None):
+        if not os.path.exists(path):
+            os.mkdir(path)
+        if os.path.exists(path + '/params.json'):
+            os.remove(path + '/params.json')
+        for name in self.arrays:
+            np.save(path + '/' + name + '.tmp.npy',getattr(self,name))
+        with open(path + '/vocabulary.json.tmp','w') as f:
+            json.dump(list(self.vocabulary),f)
+        with open(path + '/params.json.tmp','w') as f:
+            json.dump({'k1':self.k1,
+                       'b':self.b,
+                       'epsilon':self.epsilon,
+                       'avgdl':self.avgdl,
+                       'corpus_size':self.corpus_size,
+                       'metadata':metadata if metadata is not None else self.metadata}, f)
+        for name in self.arrays:
+            os.replace(path + '/' + name + '.tmp.npy',path + '/' + name + '.npy')
+        os.replace(path + '/vocabulary.json.tmp',path + '/vocabulary.json')
+        os.replace(path + '/params.json.tmp',path + '/params.json')
+
+
+
+    """Reads the metadata of an index saved with save without loading the index.
+
+        Args:
+            (str) path: path of the directory
+
+        Returns:
+            (dict) metadata: metadata given to save (None if there is no complete index in path)
+
+    """
+    @staticmethod
+    def read_metadata(path):
+        if not os.path.exists(path + '/params.json'):
+            return None
+        with open(path + '/params.json') as f:
+            return json.load(f)['metadata']
+
+
+
+    """Loads an index saved with save.
+
+        Args:
+            (str) path: path of the directory
+            (bool) mmap: if True, arrays are memory-mapped instead of being read in memory
+
+        Returns:
+            (BM25Index) index: loaded index
+
+    """
+    @classmethod
+    def load(cls,path,mmap=True):
+        index = cls.__new__(cls)
+        with open(path + '/params.json') as f:
+            params = json.load(f)
+        index.k1 = params['k1']
+        index.b = params['b']
+        index.epsilon = params['epsilon']
+        index.avgdl = params['avgdl']
+        index.corpus_size = params['corpus_size']
+        index.metadata = params['metadata']
+        for name in cls.arrays:
+            setattr(index,name,np.load(path + '/' + name + '.npy',mmap_mode='r' if mmap else None))
+        with open(path + '/vocabulary.json') as f:
+            index.vocabulary = {term:term_id for term_id,term in enumerate(json.load(f))}
+        return index
+
+
+
+    """Computes the idf of each term of the vocabulary.
+
+        Terms are visited in the order of their first occurrence in the corpus, like
+        rank_bm25, so that the average idf used for the epsilon floor is bitwise identical.
+
+        Args:
+            (numpy.ndarray) df: number of documents containing each term
+
+        Returns:
+            (numpy.ndarray) idf: idf of each term
+
+    """
+    def _compute_idf(self,df):
+        idf = np.empty(len(df))
+        idf_sum = 0
+        negative_idfs = []
+        for term_id,freq in enumerate(df.tolist()):
+            value = math.log(self.corpus_size - freq + 0.5) - math.log(freq + 0.5)
+            idf[term_id] = value
+            idf_sum += value
+            if value < 0:
+                negative_idfs.append(term_id)
+        average_idf = idf_sum / len(df)
+        idf[negative_idfs] = self.epsilon * average_idf
+        return idf
+
+
+
+    """Computes an upper bound of the contribution of each term to the score of a document.
+
+        Returns:
+            (numpy.ndarray) max_scores: maximum score contribution of each term over its postings
+
+    """
+    def _compute_max_scores(self):
+        if len(self.vocabulary) == 0:
+            return np.zeros(0)
+        contributions = self.tfs * (self.k1 + 1) / (self.tfs + self.norms[self.doc_ids])
+        return self.idf * np.maximum.reduceat(contributions,self.indptr[:-1])
+
+
+
+    """Returns the postings of a term.
+
+        Args:
+            (str) term: term of the vocabulary
+
+        Returns:
+            (int) term_id: id of the term (None if the term is not in the vocabulary)
+            (numpy.ndarray) doc_ids: positions of the documents containing the term
+            (numpy.ndarray) tfs: frequency of the term in each of these documents
+
+    """
+    def postings(self,term):
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            return None,self.doc_ids[:0],self.tfs[:0]
+        return (term_id,) + self._postings(term_id)
+
+
+
+    """Returns the postings of a term given its id.
+
+        Args:
+            (int) term_id: id of the term
+
+        Returns:
+            (numpy.ndarray) doc_ids: positions of the documents containing the term
+            (numpy.ndarray) tfs: frequency of the term in each of these documents
+
+    """
+    def _postings(self,term_id):
+        start,end = self.indptr[term_id],self.indptr[term_id+1]
+        return self.doc_ids[start:end],self.tfs[start:end]
+
+
+
+    """Computes the BM25 score of every document of the collection for a query.
+
+        Args:
+            (list) query: tokenized query
+
+        Returns:
+            (numpy.ndarray) scores: score of each document, in the order of the corpus
+
+    """
+    def get_scores(self,query):
+        scores = np.zeros(self.corpus_size)
+        for term in query:
+            term_id,doc_ids,tfs = self.postings(term)
+            if term_id is None: continue
+            scores[doc_ids] += self.idf[term_id] * (tfs * (self.k1 + 1) / (tfs + self.norms[doc_ids]))
+        return scores
+
+
+
+    """Returns the k documents with the highest BM25 score for a query.
+
+        Documents are ranked by decreasing score, ties are broken by increasing position in the corpus.
+
+        Args:
+            (list) query: tokenized query
+            (int) k: number of documents to return
+            (bool) pruning: if True, uses MaxScore dynamic pruning to skip documents that cannot enter the top k
+
+        Returns:
+            (numpy.ndarray) top_k: positions of the top documents in the corpus
+            (numpy.ndarray) scores: scores of the top documents
+
+    """
+    def top_k(self,query,k,pruning=False):
+        if pruning:
+            result = self._top_k_max_score(query,k)
+            if result is not None:
+                return result
+        scores = self.get_scores(query)
+        top_k = select_top_k(scores,k)
+        return top_k,scores[top_k]
+
+
+
+    """Computes the contribution of a term to the score of some documents.
+
+        Args:
+            (int) term_id: id of the term
+            (numpy.ndarray) doc_ids: sorted positions of the documents
+
+        Returns:
+            (numpy.ndarray) contributions: score contribution of the term for each document (0 if the term is absent)
+
+    """
+    def _contributions(self,term_id,doc_ids):
+        postings,tfs = self._postings(term_id)
+        locations = np.minimum(np.searchsorted(postings,doc_ids),len(postings) - 1)
+        tfs = np.where(postings[locations] == doc_ids,tfs[locations],0)
+        return self.idf[term_id] * (tfs * (self.k1 + 1) / (tfs + self.norms[doc_ids]))
+
+
+
+    """Top k retrieval with MaxScore dynamic pruning.
+
+        Query terms are processed by decreasing score upper bound. The k-th best contribution of a single term
+        is a lower bound of the k-th best score, so the threshold is updated after each term with a partition of
+        its contributions only. Once the sum of the upper bounds of the remaining terms is below the threshold,
+        no new document can enter the top k: the documents of the processed terms are the candidates (kept in
+        arrays of the size of their postings, not of the corpus), the remaining (usually long) postings lists are
+        only probed for the candidates, and candidates that cannot reach the k-th partial score are dropped.
+        The final candidates are rescored in the original order of the query terms so that scores are bitwise
+        identical to get_scores.
+
+        Scoring a query exhaustively is a few vectorized numpy operations, so pruning is usually not faster
+        on collections of the size of wikIR, see the --pruning option of build_wikIR.py.
+
+        Args:
+            (list) query: tokenized query
+            (int) k: number of documents to return
+
+        Returns:
+            (tuple) result: same as top_k, or None if pruning cannot be applied to this query
+
+    """
+    def _top_k_max_score(self,query,k):
+        counts = Counter(self.vocabulary[term] for term in query if term in self.vocabulary)
+        if not counts:
+            return None
+        term_ids = np.fromiter(counts.keys(),dtype=np.int64,count=len(counts))
+        bounds = np.fromiter(counts.values(),dtype=np.float64,count=len(counts)) * self.max_scores[term_ids]
+        if (self.idf[term_ids] <= 0).any():
+            return None
+
+        order = np.argsort(-bounds,kind='stable')
+        remaining = np.cumsum(bounds[order][::-1])[::-1] * (1 + 1e-9)
+
+        threshold = -np.inf
+        essential_doc_ids = []
+        essential_contributions = []
+        essential = len(order)
+        for i,position in enumerate(order):
+            if remaining[i] < threshold:
+                essential = i
+                break
+            term_id = term_ids[position]
+            doc_ids,tfs = self._postings(term_id)
+            contributions = counts[term_id] * self.idf[term_id] * (tfs * (self.k1 + 1) / (tfs + self.norms[doc_ids]))
+            essential_doc_ids.append(doc_ids)
+            essential_contributions.append(contributions)
+            if len(contributions) >= k:
+                threshold = max(threshold,np.partition(contributions,len(contributions) - k)[len(contributions) - k])
+
+        candidates,inverse = np.unique(np.concatenate(essential_doc_ids),return_inverse=True)
+        if len(candidates) < k:
+            return None
+        partial = np.bincount(inverse,weights=np.concatenate(essential_contributions),minlength=len(candidates))
+        threshold = np.partition(partial,len(partial) - k)[len(partial) - k]
+
+        for i in range(essential,len(order)):
+            kept = partial + remaining[i] >= threshold
+            candidates,partial = candidates[kept],partial[kept]
+            term_id = term_ids[order[i]]
+            partial += counts[term_id] * self._contributions(term_id,candidates)
+
+        threshold = np.partition(partial,len(candidates) - k)[len(candidates) - k]
+        candidates = candidates[partial >= threshold - 1e-9 * abs(threshold)]
+
+        scores = np.zeros(len(candidates))
+        for term in query:
+            term_id = self.vocabulary.get(term)
+            if term_id is None: continue
+            scores += self._contributions(term_id,candidates)
+        top_k = np.lexsort((candidates,-scores))[:k]
+        return candidates[top_k],scores[top_k]
+
+
+
+
+    """Returns the sparse matrix of the BM25 weights of the terms in the documents.
+
+        Row t of the matrix contains the contribution of term t to the score of each document, its
+        indptr and indices are the postings of the index. The matrix is built on first use and cached.
+
+        Returns:
+            (scipy.sparse.csr_matrix) weights: matrix of shape (size of the vocabulary, number of documents)
+
+    """
+    def weight_matrix(self):
+        if getattr(self,'_weights',None) is None:
+            idf = np.repeat(self.idf,np.diff(self.indptr))
+            weights = idf * (self.tfs * (self.k1 + 1) / (self.tfs + self.norms[self.doc_ids]))
+            self._weights = scipy.sparse.csr_matrix((weights,self.doc_ids,self.indptr),
+                                                    shape=(len(self.vocabulary),self.corpus_size))
+        return self._weights
+
+
+
+    """Returns the k documents with the highest BM25 score for each query of a batch.
+
+        The queries are turned into a sparse query-term matrix multiplied by weight_matrix, and the top k
+        of each query is selected among its non zero scores with select_top_k, ties being broken by
+        increasing position like top_k. Scores are equal to the
+        ones of get_scores up to floating point rounding (contributions are summed in a different order).
+
+        Args:
+            (list) queries: list of tokenized queries
+            (int) k: number of documents to return per query
+
+        Returns:
+            (list) results: for each query, a pair (top_k,scores) like the output of top_k
+
+    """
+    def top_k_batch(self,queries,k):
+        rows = []
+        columns = []
+        for row,query in enumerate(queries):
+            for term in query:
+                term_id = self.vocabulary.get(term)
+                if term_id is not None:
+                    rows.append(row)
+                    columns.append(term_id)
+        query_matrix = scipy.sparse.csr_matrix((np.ones(len(rows)),(rows,columns)),
+                                               shape=(len(queries),len(self.vocabulary)))
+        scores = query_matrix @ self.weight_matrix()
+        scores.eliminate_zeros()
+
+        results = []
+        for row in range(len(queries)):
+            start,end = scores.indptr[row],scores.indptr[row+1]
+            row_data = scores.data[start:end]
+            row_indices = scores.indices[start:end]
+            if end - start >= min(k,self.corpus_size):
+                top = select_top_k(row_data,k,row_indices)
+                if len(top) == 0 or row_data[top[-1]] > 0:
+                    results.append((row_indices[top].astype(np.int64),row_data[top]))
+                    continue
+            row_scores = np.zeros(self.corpus_size)
+            row_scores[row_indices] = row_data
+            top_k = select_top_k(row_scores,k)
+            results.append((top_k,row_scores[top_k]))
+        return results
+
+
+
+"""Selects the indexes of the k highest scores.
+
+    Uses a linear time partition followed by a sort of the k selected elements only.
+    Scores are ranked in decreasing order and ties are broken by increasing index (or increasing id
+    if ids is given), including ties on the k-th score.
+
+    Args:
+        (numpy.ndarray) scores: scores of the documents
+        (int) k: number of indexes to return
+        (numpy.ndarray) ids: ids used to break ties, e.g. the unsorted column indices of a sparse row (if None: indexes)
+
+    Returns:
+        (numpy.ndarray) top_k: indexes of the k highest scores, sorted
+
+"""
+def select_top_k(scores,k,ids=None):
+    if k < len(scores):
+        threshold = scores[np.argpartition(-scores,k - 1)[k - 1]]
+        above = np.flatnonzero(scores > threshold)
+        ties = np.flatnonzero(scores == threshold)
+        if ids is not None:
+            ties = ties[np.argsort(ids[ties],kind='stable')]
+        top_k = np.concatenate([above,ties[:k - len(above)]])
+    else:
+        top_k = np.arange(len(scores))
+    return top_k[np.lexsort((top_k if ids is None else ids[top_k],-scores[top_k]))]
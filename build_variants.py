@@ -0,0 +1,315 @@
+import os
+import json
+import random
+import argparse
+import numpy as np
+import checkpoints
+import profiling
+import build_wikIR
+from titles import read_redirects
+
+
+
+"""Reads the articles of a byte range of the file produced by wikiextractor (see build_wikIR.read_shard) and keeps their prefix
+    (see build_wikIR.article_window).
+
+    Args:
+        (tuple) shard: (file,start,end,min_nb_words,len_doc,only_first_sentence,language)
+
+    Returns:
+        (list) articles: list of tuples (title,nb_words,prefix) of the articles of the byte range with at least min_nb_words words
+
+"""
+def read_articles_shard(shard):
+    file,start,end,min_nb_words,len_doc,only_first_sentence,language = shard
+    tokenizer = build_wikIR.get_tokenizer(language,False)
+    articles = []
+    for article in build_wikIR.read_shard(file,start,end):
+        text = article['text']
+        nb_words = len(text.split(' '))
+        if nb_words < min_nb_words : continue
+        articles.append((article['title'],nb_words,build_wikIR.article_window(text,len_doc,only_first_sentence,tokenizer)))
+    return articles
+
+
+
+"""Reads the file produced by wikiextractor once for all the variants: keeps the title, the number of words and the prefix of
+    each article needed by all the variants (the longest len_doc, and the first sentence if a variant uses only_first_links).
+
+    Args:
+        (str) file: path to the json file produced by wikiextractor
+        (list) variants: arguments of each variant (outputs of build_wikIR.argument_parser().parse_args())
+        (int) workers: number of processes
+
+    Returns:
+        (list) titles: titles of the articles, the position of an article is its index in the shared structures
+        (numpy.ndarray) nb_words: number of words of each article
+        (list) windows: prefix of each article
+
+"""
+def read_articles(file,variants,workers):
+    min_nb_words = min(variant.min_len_doc for variant in variants)
+    len_doc = None if any(variant.len_doc is None for variant in variants) else max(variant.len_doc for variant in variants)
+    only_first_sentence = any(variant.only_first_links for variant in variants)
+    shards = [(file,start,end,min_nb_words,len_doc,only_first_sentence,variants[0].language)
+              for start,end in build_wikIR.shard_offsets(file,4*workers)]
+
+    titles = []
+    nb_words = []
+    windows = []
+    for articles in build_wikIR.map_shards(read_articles_shard,shards,workers):
+        for title,article_nb_words,window in articles:
+            titles.append(title)
+            nb_words.append(article_nb_words)
+            windows.append(window)
+    return titles,np.array(nb_words,dtype=np.int64),windows
+
+
+
+_variant_worker_state = None
+
+
+
+"""Initializes a worker process of a pool created by build_wikIR.fork_pool, that extracts links and cleans articles.
+
+    Args:
+        (list) windows: output of read_articles
+        (str) language: language of the collection
+
+"""
+def init_variant_worker(windows,language):
+    global _variant_worker_state
+    _variant_worker_state = (windows,language)
+
+
+
+"""Extracts the links or cleans a list of articles.
+
+    Args:
+        (list) windows: output of read_articles
+        (str) language: language of the collection
+        (tuple) task: ('links',(len_doc,only_first_sentence),indexes) or
+                      ('articles',(len_doc,len_query,skip_first_sentence,title_queries,lower_cased),indexes)
+
+    Returns:
+        (list) values: outputs of build_wikIR.extract_links or Tokenizer.clean_article for each article of the task
+
+"""
+def process_articles(windows,language,task):
+    kind,params,indexes = task
+    if kind == 'links':
+        len_doc,only_first_sentence = params
+        return [build_wikIR.extract_links(windows[index],len_doc,only_first_sentence) for index in indexes]
+    len_doc,len_query,skip_first_sentence,title_queries,lower_cased = params
+    tokenizer = build_wikIR.get_tokenizer(language,lower_cased)
+    return [tokenizer.clean_article(windows[index],len_doc,len_query,skip_first_sentence,title_queries) for index in indexes]
+
+
+
+"""Extracts the links or cleans a list of articles inside a worker process.
+
+    Args:
+        (tuple) task: see process_articles
+
+    Returns:
+        (list) values: see process_articles
+
+"""
+def process_articles_chunk(task):
+    windows,language = _variant_worker_state
+    return process_articles(windows,language,task)
+
+
+
+"""Links and cleaned articles shared by the variants: each article is processed once per set of parameters,
+    so that variants differing only by max_docs, min_len_doc, min_nb_rel_doc or the size of the sets reuse the same results.
+
+    Args:
+        (list) windows: output of read_articles
+        (str) language: language of the collection
+        (int) workers: number of processes
+        (int) chunk_size: number of articles sent at once to a worker
+
+"""
+class SharedArticles:
+
+    def __init__(self,windows,language,workers=1,chunk_size=1000):
+        self.windows = windows
+        self.language = language
+        self.chunk_size = chunk_size
+        self.cache = dict()
+        self.pool = None
+        if workers > 1:
+            self.pool = build_wikIR.fork_pool(workers,init_variant_worker,(windows,language))
+
+
+
+    """Returns the links or the cleaned text of articles, processing only the articles that have not been processed yet with these parameters.
+
+        Args:
+            (str) kind: 'links' or 'articles'
+            (tuple) params: parameters of build_wikIR.extract_links or Tokenizer.clean_article, see process_articles
+            (list) indexes: positions of the articles
+
+        Returns:
+            (dict) values: keys are positions of articles (at least indexes) and values are their links or (document,query) pairs
+
+    """
+    def get(self,kind,params,indexes):
+        values = self.cache.setdefault((kind,params),dict())
+        missing = [index for index in indexes if index not in values]
+        tasks = [(kind,params,missing[i:i+self.chunk_size]) for i in range(0,len(missing),self.chunk_size)]
+        if self.pool is None:
+            tasks_values = (process_articles(self.windows,self.language,task) for task in tasks)
+        else:
+            tasks_values = self.pool.imap(process_articles_chunk,tasks)
+        for task,task_values in zip(tasks,tasks_values):
+            values.update(zip(task[2],task_values))
+        return values
+
+
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+
+
+"""Builds the collection of a variant from the shared structures. The documents, queries and qrels are the ones built by
+    build_wikIR.py with the same arguments: doc ids and random sampling only depend on the articles kept by min_len_doc.
+
+    Args:
+        (argparse.Namespace) args: arguments of the variant
+        (list) titles: output of read_articles
+        (numpy.ndarray) nb_words: output of read_articles
+        (SharedArticles) articles: links and cleaned articles shared by the variants
+        (dict) redirects: keys are titles of redirect pages and values are titles of target articles (if None: links to redirect pages are not resolved)
+        (profiling.Profiler) profiler: profiler of the stages
+        (str) name: name of the variant, added to the names of the stages
+
+    Returns:
+        (tuple) collection: documents, queries, qrels, train, validation and test sets (outputs of delete_empty and build_train_validation_test)
+
+"""
+def build_variant(args,titles,nb_words,articles,redirects,profiler,name):
+    random.seed(args.random_seed)
+    positions = np.flatnonzero(nb_words >= args.min_len_doc).tolist()
+    print(len(positions),"documents have more than",args.min_len_doc,"tokens")
+    keys,documents_ids = build_wikIR.sample_documents([titles[position] for position in positions],args.max_docs,args.streaming)
+    keys = list(keys)
+    selected = [positions[key] for key in keys]
+
+    print("Building qrels",flush=True)
+    with profiler.stage('build_qrels.' + name,docs=len(keys)):
+        links = articles.get('links',(args.len_doc,args.only_first_links),selected)
+        qrels = build_wikIR.build_qrels_from_links(keys,((key,links[positions[key]]) for key in keys),documents_ids,args.min_nb_rel_doc,redirects)
+        profiling.add_items(queries=len(qrels))
+    print(len(qrels),"qrels have been built",flush=True)
+
+    print("Cleaning queries and documents",flush=True)
+    with profiler.stage('clean_docs_and_build_queries.' + name,docs=len(keys)):
+        cleaned = articles.get('articles',(args.len_doc,args.len_query,args.skip_first_sentence,args.title_queries,args.lower_cased),selected)
+        documents = dict()
+        queries = dict()
+        for key in keys:
+            documents[key],query = cleaned[positions[key]]
+            if key in qrels:
+                queries[key] = query
+
+    print('Removing empty documents and queries',flush=True)
+    with profiler.stage('delete_empty.' + name,docs=len(documents),queries=len(queries)):
+        documents,queries,qrels = build_wikIR.delete_empty(documents,queries,qrels)
+
+    train,validation,test = build_wikIR.build_train_validation_test(queries,args.validation_part,args.test_part)
+    return documents,queries,qrels,train,validation,test
+
+
+
+"""Reads the variants of a configuration file: a json list of objects with an output_dir and any argument of build_wikIR.py
+    (long names, e.g. {"output_dir":"wikIR1k","max_docs":370000,"title_queries":true}). Missing arguments take the values
+    given on the command line of build_variants.py or the default values of build_wikIR.py.
+
+    Args:
+        (str) config_file: path of the configuration file
+        (argparse.Namespace) defaults: arguments shared by all the variants
+        (str) output_root: directory in which the output_dir of the variants are created (if None: output_dir are used as they are)
+
+    Returns:
+        (list) variants: arguments of each variant
+
+"""
+def read_variants(config_file,defaults,output_root=None):
+    with open(config_file,'r') as f:
+        configs = json.load(f)
+    variants = []
+    for config in configs:
+        unknown = set(config) - set(vars(defaults))
+        if unknown:
+            raise ValueError('Unknown arguments in ' + config_file + ': ' + ', '.join(sorted(unknown)))
+        variant = argparse.Namespace(**{**vars(defaults),**config})
+        if output_root is not None:
+            variant.output_dir = os.path.join(output_root,variant.output_dir)
+        variants.append(variant)
+
+    for key in ('input','language'):
+        if len(set(getattr(variant,key) for variant in variants)) > 1:
+            raise ValueError('All the variants must have the same ' + key + ', use one configuration file per dump')
+    return variants
+
+
+
+def main():
+
+    parser = build_wikIR.argument_parser()
+    parser.add_argument('--variants', nargs="?", type=str)
+    parser.add_argument('--output_root', nargs="?", type=str, default = None)
+    args = parser.parse_args()
+
+    defaults = argparse.Namespace(**{key:value for key,value in vars(args).items() if key not in ('variants','output_root')})
+    variants = read_variants(args.variants,defaults,args.output_root)
+    profiler = profiling.Profiler(args.profile is not None,args.profile_dir,args.trace_memory)
+    if args.output_root is not None and not os.path.exists(args.output_root):
+        os.makedirs(args.output_root)
+
+    collections = [None]*len(variants)
+    collection_keys = [None]*len(variants)
+    for i,variant in enumerate(variants):
+        if variant.checkpoint_dir:
+            collection_keys[i] = build_wikIR.get_collection_key(variant)
+            collections[i] = checkpoints.load_stage(variant.checkpoint_dir,'collection',collection_keys[i])
+
+    missing = [variant for variant,collection in zip(variants,collections) if collection is None]
+    if missing:
+        print("Reading wikiextractor file once for",len(missing),"variants",flush=True)
+        with profiler.stage('read_articles'):
+            titles,nb_words,windows = read_articles(missing[0].input,missing,args.workers)
+            profiling.add_items(docs=len(titles))
+        articles = SharedArticles(windows,missing[0].language,args.workers)
+    redirects = dict()
+
+    try:
+        for i,variant in enumerate(variants):
+            print('Building',variant.output_dir,flush=True)
+            build_wikIR.create_output_dir(variant.output_dir)
+            collection = collections[i]
+            if collection is None:
+                if variant.redirects and variant.redirects not in redirects:
+                    redirects[variant.redirects] = read_redirects(variant.redirects)
+                    print(len(redirects[variant.redirects]),"redirects have been read",flush=True)
+                collection = build_variant(variant,titles,nb_words,articles,redirects.get(variant.redirects),profiler,
+                                           os.path.basename(os.path.normpath(variant.output_dir)))
+                if variant.checkpoint_dir:
+                    checkpoints.save_stage(variant.checkpoint_dir,'collection',collection_keys[i],collection)
+            collections[i] = None
+            build_wikIR.save_collection(variant,collection,collection_keys[i],profiler)
+    finally:
+        if missing:
+            articles.close()
+
+    if args.profile:
+        profiler.save(args.profile,{'variants':[vars(variant) for variant in variants]})
+        print('Profile saved in',args.profile,flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,23 @@ import re
 import os
 import json
 import random
+import shutil
+import hashlib
 import argparse
-import pytrec_eval
+import functools
+import itertools
+import multiprocessing
 import numpy as np
-import pandas as pd
-from rank_bm25 import BM25Okapi
+import checkpoints
+import profiling
+import trec
+import writers
+import columnar
+from array import array
+from qrels import Qrels
+from titles import TitleIndex,read_redirects
+from evaluation import Evaluator,run_from_results,run_from_arrays
+from bm25 import BM25Index
 from nltk.corpus import stopwords
 from nltk.stem.porter import PorterStemmer
 from nltk.stem.snowball import FrenchStemmer
@@ -39,7 +51,7 @@ def read_wikiextractor(file,min_nb_words,max_docs):
             doc_id += 1
             
     if max_docs:
-        titles = random.sample(documents_ids.keys(),k = max_docs)
+        titles = random.sample(list(documents_ids),k = max_docs)
         documents_ids = {title: documents_ids[title] for title in titles}
         documents = {d_id: documents[d_id] for d_id in documents_ids.values()}
         return documents,documents_ids
@@ -49,6 +61,154 @@ def read_wikiextractor(file,min_nb_words,max_docs):
 
 
 
+"""Returns the prefix of an article that is enough to build its links, document and query.
+
+    The prefix must contain the first len_doc words used for the links (or the first sentence if only_first_sentence),
+    the title, the first sentence and at least len_doc+1 tokens after it once cleaned, and must not end inside an html tag.
+    build_qrels and clean_docs_and_build_queries therefore give the same output on the prefix as on the full text.
+    
+    Args:
+        (str) text: raw text of the article
+        (int) len_doc: number of words from the article kept in the documents (if None: keep all words)
+        (bool) only_first_sentence: indicates whether or not only the links of the first sentence are used
+        (Tokenizer) tokenizer: tokenizer used by clean_docs_and_build_queries
+        
+    Returns:
+        (str) prefix: prefix of the article
+        
+"""
+def article_window(text,len_doc,only_first_sentence,tokenizer):
+    if len_doc is None:
+        return text
+    end = max(1024,10*len_doc)
+    while end < len(text):
+        prefix = text[:end]
+        end *= 2
+        if prefix.count(' ') < len_doc or prefix.rfind('<') > prefix.rfind('>'):
+            continue
+        if only_first_sentence and prefix.find('.',max(prefix.find('\n'),0)) < 0:
+            continue
+        document = tokenizer.tag_regex.sub('',prefix)
+        end_of_title = document.find('\n')
+        first_sentence_location = document.find('. ',end_of_title)
+        if end_of_title < 0 or first_sentence_location < 0:
+            continue
+        nb_tokens = 0
+        for _ in tokenizer.token_regex.finditer(document,first_sentence_location):
+            nb_tokens += 1
+            if nb_tokens > len_doc:
+                return prefix
+    return text
+
+
+
+
+"""Reads the file produced by wikiextractor without keeping full articles in memory.
+    
+    Only the prefix of each article used by build_qrels and clean_docs_and_build_queries is kept (see article_window).
+    When max_docs is used, articles are sampled on the fly with reservoir sampling, so that the memory used
+    depends on the size of the collection and not on the size of the dump.
+    
+    Args:
+        (str) file: path to the json file produced by wikiextractor
+        (int) min_nb_words: minimum number of words in the article required to add it to the collection 
+        (int) max_docs: maximum number of documents in the collection (if None: keep all documents)
+        (int) len_doc: number of words from the article to keep in the documents (if None: keep all words) 
+        (bool) only_first_sentence: indicates whether or not to use only the links of the first sentence of articles to build the qrels
+        (str) language: language of the collection
+        
+    Returns:
+        (dict) documents: keys are doc ids and values are the prefixes of wikipedia articles
+        (dict) documents_ids: keys are articles titles and values are the associated doc_ids
+
+"""
+def read_wikiextractor_stream(file,min_nb_words,max_docs,len_doc,only_first_sentence,language):
+    tokenizer = get_tokenizer(language,False)
+    reservoir = []
+    doc_id = 0
+    with open(file) as f:
+        for line in f:
+            article = json.loads(line)
+            text = article['text']
+            if len(text.split(' ')) < min_nb_words : continue
+            if max_docs is None or doc_id < max_docs:
+                reservoir.append((doc_id,article['title'],article_window(text,len_doc,only_first_sentence,tokenizer)))
+            else:
+                position = random.randrange(doc_id + 1)
+                if position < max_docs:
+                    reservoir[position] = (doc_id,article['title'],article_window(text,len_doc,only_first_sentence,tokenizer))
+            doc_id += 1
+    
+    reservoir.sort(key=lambda elem: elem[0])
+    documents = dict()
+    documents_ids = dict()
+    for doc_id,title,text in reservoir:
+        documents_ids[title] = doc_id
+        documents[doc_id] = text
+    return documents,documents_ids
+
+
+
+
+"""Extracts the targets of the links of an article used to build the qrels.
+    
+    Args:
+        (str) text: raw text of the article
+        (int) len_doc: number of words from the article in which links are searched (if None: all words) 
+        (bool) only_first_sentence: indicates whether or not to use only the links of the first sentence of the article
+        
+    Returns:
+        (list) links: href attributes of the links
+    
+"""
+def extract_links(text,len_doc,only_first_sentence):
+    if only_first_sentence:
+        end_of_title = text.find('\n')
+        short_doc = text[end_of_title:]
+        first_sentence_location = short_doc.find('.')
+        short_doc = short_doc[:first_sentence_location]
+    else:
+        short_doc = ' '.join(text.split(' ')[:len_doc])
+    return re.findall(r'(?:href=")([^"]+)', short_doc)
+
+
+
+
+"""Produces the qrels from the links extracted from each document.
+    
+    Args:
+        (iterable) keys: doc ids of the collection
+        (iterable) links: pairs (doc_id,links) where links is an output of extract_links
+        (dict) documents_ids: keys are articles titles and values are the associated doc_ids
+        (int) min_rel: minimum number of relevant doucments asosciated to the query to add the query to the qrel
+        (dict) redirects: keys are titles of redirect pages and values are titles of target articles (if None: links to redirect pages are not resolved)
+        
+    Returns:
+        (qrels.Qrels) qrels: relevance judgments, (doc_ids,relevance_level) pairs grouped by query id
+    
+"""
+def build_qrels_from_links(keys,links,documents_ids,min_rel,redirects=None):
+    title_index = TitleIndex(documents_ids,redirects)
+    query_ids = array('q')
+    doc_ids = array('q')
+    nb_links = 0
+    for key,list_qrels in links:
+        nb_links += len(list_qrels)
+        linked_docs = title_index.resolve(list_qrels)
+        linked_docs.discard(key)
+        query_ids.extend(linked_docs)
+        doc_ids.extend([key]*len(linked_docs))
+    
+    profiling.add_items(links=nb_links)
+    keys = np.fromiter(keys,dtype=np.int64)
+    qrels = Qrels.from_pairs(keys,np.frombuffer(query_ids,dtype=np.int64),np.frombuffer(doc_ids,dtype=np.int64),min_rel)
+    print(len(keys),"qrels are initially build")
+    print(len(keys) - len(qrels),"qrels have less than",min_rel,"relevant documents")
+    return qrels
+
+
+
+
 """Produces the qrel file than contains relevance judgments between queries and documents using links in documents.
     
     Args:
@@ -57,36 +217,138 @@ def read_wikiextractor(file,min_nb_words,max_docs):
         (int) len_doc: number of words from the article to keep in the documents (if None: keep all words) 
         (int) min_rel: minimum number of relevant doucments asosciated to the query to add the query to the qrel
         (bool) only_first_sentence: indicates whether or not to use only the links of the first sentence of articles to build the qrels
+        (dict) redirects: keys are titles of redirect pages and values are titles of target articles (if None: links to redirect pages are not resolved)
         
     Returns:
-        (dict) qrels: keys are queries ids and values are a list of pair (doc_ids,relevance_level)
+        (qrels.Qrels) qrels: relevance judgments, (doc_ids,relevance_level) pairs grouped by query id
     
 """
-def build_qrels(documents,documents_ids,len_doc,min_rel,only_first_sentence):
-    qrels = {key:[] for key in documents}
-    for key,value in documents.items():
-        if only_first_sentence:
-            end_of_title = value.find('\n')
-            short_doc = value[end_of_title:]
-            first_sentence_location = short_doc.find('.')
-            short_doc = short_doc[:first_sentence_location]
+def build_qrels(documents,documents_ids,len_doc,min_rel,only_first_sentence,redirects=None):
+    links = ((key,extract_links(value,len_doc,only_first_sentence)) for key,value in documents.items())
+    return build_qrels_from_links(documents,links,documents_ids,min_rel,redirects)
+
+
+
+
+"""Cleans wikipedia articles and builds queries: removes html tags and special characters, lower cases and truncates.
+    
+    Tokens are the maximal sequences of characters allowed in the language once html tags are removed, which is
+    exactly what splitting the text after replacing special characters by spaces gives. Regexes are compiled once
+    per tokenizer and only the beginning of an article is cleaned: html tags are removed from a growing prefix of
+    the article and tokens are read one by one until len_doc tokens have been produced.
+    
+    Args:
+        (str) language: language of the collection
+        (bool) lower_cased: indicated whether or not to lower case documents and queries
+        
+"""
+class Tokenizer:
+    
+    def __init__(self,language,lower_cased):
+        self.lower_cased = lower_cased
+        self.tag_regex = re.compile('<[^>]+>')
+        if language=='en':
+            self.token_regex = re.compile('[a-zA-Z0-9]+')
         else:
-            short_doc = ' '.join(value.split(' ')[:len_doc])
-        list_qrels = re.findall(r'(?:href=")([^"]+)', short_doc)
-        linked_docs = set([documents_ids[elem.replace('%20',' ')] for elem in list_qrels if elem.replace('%20',' ') in documents_ids])
-        linked_docs.discard(key)
-        for document in linked_docs:
-            qrels[document].append([key,1])
+            self.token_regex = re.compile('[a-zÀ-ÿA-Z0-9]+')
+    
+    
+    
+    """Returns the first tokens of a text.
+    
+        Args:
+            (str) text: text without html tags
+            (int) max_tokens: maximum number of tokens (if None: all tokens)
+            
+        Returns:
+            (list) tokens: list of tokens
             
-    print(len(qrels),"qrels are initially build")
+    """
+    def tokens(self,text,max_tokens=None):
+        return [match.group() for match in itertools.islice(self.token_regex.finditer(text),max_tokens)]
     
-    delete = [key for key in qrels if len(qrels[key]) < min_rel]
     
-    print(len(delete),"qrels have less than",min_rel,"relevant documents")
     
-    for key in delete : del qrels[key]
-    for key in qrels: qrels[key].insert(0,[key,2])
-    return qrels
+    """Cleans a text without html tags.
+    
+        Args:
+            (str) text: text without html tags
+            (int) max_tokens: maximum number of tokens kept (if None: all tokens)
+            
+        Returns:
+            (str) text: cleaned text
+            
+    """
+    def clean(self,text,max_tokens=None):
+        text = ' '.join(self.tokens(text,max_tokens))
+        if self.lower_cased:
+            return text.lower()
+        return text
+    
+    
+    
+    """Cleans an article and builds the associated query.
+    
+        Args:
+            (str) text: raw text of the article
+            (int) len_doc: number of words from the article to keep in the document (if None: keep all words) 
+            (int) len_query: maximum number of words in the query (if None: keep all words) 
+            (bool) skip_first_sentence: indicates whether or not to remove the first sentence of the article from the document
+            (bool) title_queries: if True the query will be the article title; if False the query will be the first sentence of the article
+            
+        Returns:        
+            (str) document: cleaned text of the article
+            (str) query: cleaned text of the query
+    """
+    def clean_article(self,text,len_doc,len_query,skip_first_sentence,title_queries):
+        end = len(text) if len_doc is None else max(1024,10*len_doc)
+        while True:
+            complete = end >= len(text)
+            prefix = text if complete else text[:end]
+            end *= 2
+            if not complete and prefix.rfind('<') > prefix.rfind('>'):
+                continue
+            
+            document = self.tag_regex.sub('',prefix)
+            end_of_title = document.find('\n')
+            if not complete and end_of_title < 0:
+                continue
+            
+            title = document[:end_of_title]
+            document = document[end_of_title:]
+            first_sentence_location = document.find('. ')
+            if not complete and first_sentence_location < 0:
+                continue
+            
+            query = title if title_queries else document[:first_sentence_location]
+            if skip_first_sentence:
+                document = document[first_sentence_location:]
+            
+            if complete:
+                return self.clean(document,len_doc),self.clean(query,len_query)
+            tokens = self.tokens(document,len_doc + 1)
+            if len(tokens) > len_doc:
+                document = ' '.join(tokens[:len_doc])
+                if self.lower_cased:
+                    document = document.lower()
+                return document,self.clean(query,len_query)
+
+
+
+
+"""Returns the tokenizer of a language, tokenizers are built once and cached.
+    
+    Args:
+        (str) language: language of the collection
+        (bool) lower_cased: indicated whether or not to lower case documents and queries
+        
+    Returns:
+        (Tokenizer) tokenizer: tokenizer of the language
+        
+"""
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(language,lower_cased):
+    return Tokenizer(language,lower_cased)
 
 
 
@@ -94,7 +356,7 @@ def build_qrels(documents,documents_ids,len_doc,min_rel,only_first_sentence):
 """Clean the documents by removing special characters and href attributes and build the queries.
     
     Args:
-        (dict) qrels: output of read_wikiextractor
+        (qrels.Qrels) qrels: output of read_wikiextractor
         (dict) documents: output of read_wikiextractor
         (int) len_doc: number of words from the article to keep in the documents (ifNone: keep all words) 
         (int) len_query: maximum number of words in the query (if None: keep all words) 
@@ -109,45 +371,274 @@ def build_qrels(documents,documents_ids,len_doc,min_rel,only_first_sentence):
 def clean_docs_and_build_queries(qrels,documents,len_doc,len_query,skip_first_sentence,title_queries,lower_cased,language):
     
     queries = dict()
+    tokenizer = get_tokenizer(language,lower_cased)
+
+    for key,value in documents.items():
+        documents[key],query = tokenizer.clean_article(value,len_doc,len_query,skip_first_sentence,title_queries)
+        if key in qrels:
+            queries[key] = query
+
+    return documents,queries
+
+
+
+
+"""Splits a file into byte ranges of similar size.
+    
+    Args:
+        (str) file: path of the file
+        (int) nb_shards: number of byte ranges
+        
+    Returns:
+        (list) shards: list of pairs (start,end) of byte offsets
+        
+"""
+def shard_offsets(file,nb_shards):
+    size = os.path.getsize(file)
+    bounds = [size*i//nb_shards for i in range(nb_shards + 1)]
+    return [(bounds[i],bounds[i+1]) for i in range(nb_shards) if bounds[i] < bounds[i+1]]
+
+
+
+
+"""Reads the articles of a byte range of the file produced by wikiextractor.
+    
+    A line belongs to the byte range containing its first byte.
+    
+    Args:
+        (str) file: path to the json file produced by wikiextractor
+        (int) start: first byte of the range
+        (int) end: byte following the range
+        
+    Returns:
+        (generator) articles: articles of the byte range (dictionaries decoded from the json lines)
+        
+"""
+def read_shard(file,start,end):
+    with open(file,'rb') as f:
+        if start > 0:
+            f.seek(start - 1)
+            if f.read(1) != b'\n':
+                f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line: break
+            yield json.loads(line)
+
+
+
+
+"""Applies a function to shards, in a pool of worker processes if workers is greater than 1.
     
-    if language=='en':
-        regex = re.compile('[^a-zA-Z0-9]')
+    Args:
+        (function) function: function applied to each shard (must be picklable when workers is greater than 1)
+        (list) shards: arguments of the function
+        (int) workers: number of processes
+        
+    Returns:
+        (generator) results: outputs of the function, in the order of the shards
+        
+"""
+def map_shards(function,shards,workers):
+    if workers <= 1:
+        yield from map(function,shards)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap(function,shards)
+
+
+
 
+"""Creates a pool of worker processes, with the fork start method when it is available.
+    
+    With the fork start method the initialization arguments are inherited by the workers without being copied,
+    so large read-only structures (e.g. a BM25 index) are shared between all the processes of the pool.
+    
+    Args:
+        (int) workers: number of processes
+        (function) initializer: function called by each worker when it starts
+        (tuple) initargs: arguments of the initializer
+        
+    Returns:
+        (multiprocessing.pool.Pool) pool: the pool
+        
+"""
+def fork_pool(workers,initializer,initargs):
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
     else:
-        regex = re.compile('[^a-zÀ-ÿA-Z0-9]')
+        context = multiprocessing.get_context()
+    return context.Pool(workers,initializer=initializer,initargs=initargs)
 
-    for key,value in documents.items():
+
+
+
+"""Reads, extracts the links and cleans the articles of a byte range of the file produced by wikiextractor (see read_shard).
+    
+    Args:
+        (tuple) shard: (file,start,end,min_nb_words,len_doc,len_query,only_first_sentence,skip_first_sentence,title_queries,lower_cased,language)
         
-        document = re.sub('<[^>]+>', '', value)
-        end_of_title = document.find('\n')
+    Returns:
+        (list) articles: list of tuples (title,links,document,query) of the articles of the byte range with at least min_nb_words words
         
-        if title_queries and key in qrels:
-            queries[key] = document[:end_of_title]
-            
-        document = document[end_of_title:]
-        first_sentence_location = document.find('. ')
+"""
+def process_shard(shard):
+    file,start,end,min_nb_words,len_doc,len_query,only_first_sentence,skip_first_sentence,title_queries,lower_cased,language = shard
+    tokenizer = get_tokenizer(language,lower_cased)
+    articles = []
+    for article in read_shard(file,start,end):
+        text = article['text']
+        if len(text.split(' ')) < min_nb_words : continue
+        links = extract_links(text,len_doc,only_first_sentence)
+        document,query = tokenizer.clean_article(text,len_doc,len_query,skip_first_sentence,title_queries)
+        articles.append((article['title'],links,document,query))
+    return articles
+
+
+
+
+"""Samples max_docs documents exactly like read_wikiextractor or read_wikiextractor_stream, from the titles of the articles.
+    
+    Args:
+        (list) titles: titles of the articles with at least min_nb_words words, in the order of the file (the doc id of an article is its position)
+        (int) max_docs: maximum number of documents in the collection (if None: keep all documents)
+        (bool) streaming: indicates whether documents are sampled like read_wikiextractor_stream (True) or like read_wikiextractor (False)
         
-        if not title_queries and key in qrels:
-            queries[key] = document[:first_sentence_location]
-            
-        if skip_first_sentence:
-            if lower_cased:
-                documents[key] = ' '.join(regex.sub(' ', document[first_sentence_location:]).lower().split()[:len_doc])
-            else:
-                documents[key] = ' '.join(regex.sub(' ', document[first_sentence_location:]).split()[:len_doc])
-        else:
-            if lower_cased:
-                documents[key] = ' '.join(regex.sub(' ', document).lower().split()[:len_doc])
+    Returns:
+        (list) keys: doc ids of the sampled documents
+        (dict) documents_ids: keys are articles titles and values are the associated doc_ids
+        
+"""
+def sample_documents(titles,max_docs,streaming):
+    keys = range(len(titles))
+    documents_ids = {title:doc_id for doc_id,title in enumerate(titles)}
+    if max_docs and streaming:
+        keys = []
+        for doc_id in range(len(titles)):
+            if doc_id < max_docs:
+                keys.append(doc_id)
             else:
-                documents[key] = ' '.join(regex.sub(' ', document).split()[:len_doc])
+                position = random.randrange(doc_id + 1)
+                if position < max_docs:
+                    keys[position] = doc_id
+        keys.sort()
+        documents_ids = {titles[doc_id]:doc_id for doc_id in keys}
+    elif max_docs:
+        sampled_titles = random.sample(list(documents_ids),k = max_docs)
+        documents_ids = {title: documents_ids[title] for title in sampled_titles}
+        keys = list(documents_ids.values())
+    return keys,documents_ids
+
+
+
+
+"""Reads, extracts the links and cleans all the articles of the wikiextractor file, by byte ranges processed in parallel
+    (or one after the other if workers is 1). The output does not depend on max_docs nor on the random seed.
+    
+    Args:
+        (str) file: path to the json file produced by wikiextractor
+        (int) min_nb_words: minimum number of words in the article required to add it to the collection 
+        (int) len_doc: number of words from the article to keep in the documents (if None: keep all words) 
+        (int) len_query: maximum number of words in the query (if None: keep all words) 
+        (bool) only_first_sentence: indicates whether or not to use only the links of the first sentence of articles to build the qrels
+        (bool) skip_first_sentence: indicates whether or not to remove the first sentence of the article when building the associated document
+        (bool) title_queries: if True the query will be the article title; if False the query will be the first sentence of the article
+        (bool) lower_cased: indicated whether or not to lower case the collection
+        (str) language: language of the collection
+        (int) workers: number of processes
         
+    Returns:        
+        (list) titles: titles of the articles with at least min_nb_words words, in the order of the file
+        (list) links: output of extract_links for each article
+        (list) cleaned: pairs (document,query) of cleaned texts for each article
+"""
+def read_and_clean_articles(file,min_nb_words,len_doc,len_query,only_first_sentence,skip_first_sentence,title_queries,lower_cased,language,workers):
+    shards = [(file,start,end,min_nb_words,len_doc,len_query,only_first_sentence,skip_first_sentence,title_queries,lower_cased,language)
+              for start,end in shard_offsets(file,4*workers)]
+    
+    titles = []
+    links = []
+    cleaned = []
+    for articles in map_shards(process_shard,shards,workers):
+        for title,article_links,document,query in articles:
+            titles.append(title)
+            links.append(article_links)
+            cleaned.append((document,query))
+    
+    print(len(cleaned),"documents have more than",min_nb_words,"tokens")
+    return titles,links,cleaned
+
+
+
+
+"""Samples the documents and builds the qrels and queries from the output of read_and_clean_articles.
+    
+    Args:
+        (list) titles: output of read_and_clean_articles
+        (list) links: output of read_and_clean_articles
+        (list) cleaned: output of read_and_clean_articles
+        (int) max_docs: maximum number of documents in the collection (if None: keep all documents)
+        (int) min_rel: minimum number of relevant doucments asosciated to the query to add the query to the qrel
+        (bool) streaming: indicates whether max_docs documents are sampled like read_wikiextractor_stream (True) or like read_wikiextractor (False)
+        (dict) redirects: keys are titles of redirect pages and values are titles of target articles (if None: links to redirect pages are not resolved)
+        
+    Returns:        
+        (dict) documents: keys are doc ids and values are cleaned text of wikipedia articles
+        (dict) queries: keys are queries ids and values are cleaned text of queries
+        (qrels.Qrels) qrels: relevance judgments, (doc_ids,relevance_level) pairs grouped by query id
+"""
+def build_collection_from_articles(titles,links,cleaned,max_docs,min_rel,streaming,redirects=None):
+    keys,documents_ids = sample_documents(titles,max_docs,streaming)
+    
+    print("Building qrels",flush=True)
+    qrels = build_qrels_from_links(keys,((key,links[key]) for key in keys),documents_ids,min_rel,redirects)
+    
+    print(len(qrels),"qrels have been built",flush=True)
+    
+    documents = dict()
+    queries = dict()
+    for key in keys:
+        documents[key],query = cleaned[key]
         if key in qrels:
-            if lower_cased:
-                    queries[key] = ' '.join(regex.sub(' ', queries[key]).lower().split()[:len_query])
-            else:
-                queries[key] = ' '.join(regex.sub(' ', queries[key]).split()[:len_query])
+            queries[key] = query
+    return documents,queries,qrels
 
-    return documents,queries
+
+
+
+"""Builds the documents, queries and qrels by processing byte ranges of the wikiextractor file in parallel.
+    
+    Links are extracted and articles are cleaned in the worker processes (read_and_clean_articles), then the shards are merged
+    in the order of the file: documents ids, sampling of max_docs documents, qrels and queries (build_collection_from_articles)
+    are exactly the ones of the sequential pipeline (read_wikiextractor or read_wikiextractor_stream, build_qrels and 
+    clean_docs_and_build_queries).
+    
+    Args:
+        (str) file: path to the json file produced by wikiextractor
+        (int) min_nb_words: minimum number of words in the article required to add it to the collection 
+        (int) max_docs: maximum number of documents in the collection (if None: keep all documents)
+        (int) len_doc: number of words from the article to keep in the documents (if None: keep all words) 
+        (int) len_query: maximum number of words in the query (if None: keep all words) 
+        (int) min_rel: minimum number of relevant doucments asosciated to the query to add the query to the qrel
+        (bool) only_first_sentence: indicates whether or not to use only the links of the first sentence of articles to build the qrels
+        (bool) skip_first_sentence: indicates whether or not to remove the first sentence of the article when building the associated document
+        (bool) title_queries: if True the query will be the article title; if False the query will be the first sentence of the article
+        (bool) lower_cased: indicated whether or not to lower case the collection
+        (str) language: language of the collection
+        (bool) streaming: indicates whether max_docs documents are sampled like read_wikiextractor_stream (True) or like read_wikiextractor (False)
+        (int) workers: number of processes
+        (dict) redirects: keys are titles of redirect pages and values are titles of target articles (if None: links to redirect pages are not resolved)
+        
+    Returns:        
+        (dict) documents: keys are doc ids and values are cleaned text of wikipedia articles
+        (dict) queries: keys are queries ids and values are cleaned text of queries
+        (qrels.Qrels) qrels: relevance judgments, (doc_ids,relevance_level) pairs grouped by query id
+"""
+def build_collection_sharded(file,min_nb_words,max_docs,len_doc,len_query,min_rel,only_first_sentence,
+                             skip_first_sentence,title_queries,lower_cased,language,streaming,workers,redirects=None):
+    titles,links,cleaned = read_and_clean_articles(file,min_nb_words,len_doc,len_query,only_first_sentence,
+                                                   skip_first_sentence,title_queries,lower_cased,language,workers)
+    return build_collection_from_articles(titles,links,cleaned,max_docs,min_rel,streaming,redirects)
 
 
 
@@ -157,12 +648,12 @@ def clean_docs_and_build_queries(qrels,documents,len_doc,len_query,skip_first_se
     Args:
         (dict) documents: output of clean_docs_and_build_queries
         (dict) queries: output of clean_docs_and_build_queries
-        (dict) qrels: output of build_qrels
+        (qrels.Qrels) qrels: output of build_qrels
         
     Returns:
         (dict) documents: output of clean_docs_and_build_queries
         (dict) queries: output of clean_docs_and_build_queries
-        (dict) qrels: output of build_qrels
+        (qrels.Qrels) qrels: output of build_qrels
         
 """
 def delete_empty(documents,queries,qrels):
@@ -176,28 +667,22 @@ def delete_empty(documents,queries,qrels):
     
     print(nb_empty,'empty documents have been deleted',flush=True)
     
-    nb_empty = 0
+    empty_queries = []
     for key in [elem for elem in queries]:
         if queries[key].isspace() or not queries[key] or key in empty_documents:
             del queries[key]
-            del qrels[key]
-            nb_empty += 1
+            empty_queries.append(key)
+    qrels = qrels.remove_queries(empty_queries)
     
-    print(nb_empty,'empty queries have been deleted',flush=True)
+    print(len(empty_queries),'empty queries have been deleted',flush=True)
     print('There are',len(documents),'documents',flush=True)
     print('There are',len(queries),'queries',flush=True)
     
-    nb_paires = 0
-    for key in [elem for elem in qrels]:
-        new_list = [x for x in qrels[key] if x[0] not in empty_documents]
-        if new_list != []:
-            qrels[key] = new_list
-            nb_paires += len(new_list)
-        else:
-            del qrels[key]
-            del queries[key]
+    qrels = qrels.remove_documents(empty_documents)
+    for key in [elem for elem in queries if elem not in qrels]:
+        del queries[key]
     
-    print('There are',nb_paires,'(queries,documents) paires labelled with a relevance level of 1 or higher')
+    print('There are',qrels.nb_pairs(),'(queries,documents) paires labelled with a relevance level of 1 or higher')
     return documents,queries,qrels
 
 
@@ -209,7 +694,7 @@ def delete_empty(documents,queries,qrels):
     Args:
         (dict) documents: output of clean_docs_and_build_queries
         (dict) queries: output of clean_docs_and_build_queries
-        (dict) qrels: output of build_qrels
+        (qrels.Qrels) qrels: output of build_qrels
         
     Returns:
         (list) train: list of queries ids in the training set
@@ -240,22 +725,10 @@ def build_train_validation_test(queries,validation_part,test_part):
                 
 """
 def save_csv(output_dir,documents,queries,train,validation,test):
-    
-    index = pd.Index([key for key in documents],name = 'id_right')
-    d = {"text_right":[documents[key] for key in documents]}
-    pd.DataFrame(data=d,index=index).to_csv(output_dir + '/documents.csv')
-    
-    index = pd.Index([key for key in train],name = 'id_left')
-    d = {"text_left":[queries[key] for key in train]}
-    pd.DataFrame(data=d,index=index).to_csv(output_dir + '/training/queries.csv')
-    
-    index = pd.Index([key for key in validation],name = 'id_left')
-    d = {"text_left":[queries[key] for key in validation]}
-    pd.DataFrame(data=d,index=index).to_csv(output_dir + '/validation/queries.csv')
-    
-    index = pd.Index([key for key in test],name = 'id_left')
-    d = {"text_left":[queries[key] for key in test]}
-    pd.DataFrame(data=d,index=index).to_csv(output_dir + '/test/queries.csv')
+    writers.write_csv(output_dir + '/documents.csv',['id_right','text_right'],documents.items())
+    writers.write_csv(output_dir + '/training/queries.csv',['id_left','text_left'],((key,queries[key]) for key in train))
+    writers.write_csv(output_dir + '/validation/queries.csv',['id_left','text_left'],((key,queries[key]) for key in validation))
+    writers.write_csv(output_dir + '/test/queries.csv',['id_left','text_left'],((key,queries[key]) for key in test))
 
     
     
@@ -272,17 +745,10 @@ def save_csv(output_dir,documents,queries,train,validation,test):
                 
 """
 def save_json(output_dir,documents,queries,train,validation,test):            
-    with open(output_dir + '/documents.json','w') as f:
-        json.dump(documents, f)
-
-    with open(output_dir + '/training/queries.json','w') as f:
-        json.dump({key:queries[key] for key in train}, f)
-
-    with open(output_dir + '/validation/queries.json','w') as f:
-        json.dump({key:queries[key] for key in validation}, f)
-
-    with open(output_dir + '/test.queries/json','w') as f:
-        json.dump({key:queries[key] for key in test}, f)
+    writers.write_json_object(output_dir + '/documents.json',documents.items())
+    writers.write_json_object(output_dir + '/training/queries.json',((key,queries[key]) for key in train))
+    writers.write_json_object(output_dir + '/validation/queries.json',((key,queries[key]) for key in validation))
+    writers.write_json_object(output_dir + '/test/queries.json',((key,queries[key]) for key in test))
     
     
     
@@ -298,21 +764,54 @@ def save_json(output_dir,documents,queries,train,validation,test):
                 
 """
 def save_xml(output_dir,documents,queries,train,validation,test):
-    with open(output_dir + '/documents.xml','w') as f:
-        for key,value in documents.items():
-            f.write('<DOC>\n<DOCNO>' + str(key) + '</DOCNO>\n<TEXT>\n' + value + '\n</TEXT></DOC>\n')
-
-    with open(output_dir + '/training/queries.xml','w') as f:
-        for key in train:
-            f.write('<top>\n<num>' + str(key) + '</num><title>\n' + queries[key] + '\n</title>\n</top>\n')
-
-    with open(output_dir + '/validation/queries.xml','w') as f:
-        for key in validation:
-            f.write('<top>\n<num>' + str(key) + '</num><title>\n' + queries[key] + '\n</title>\n</top>\n')
-
-    with open(output_dir + '/test/queries.xml','w') as f:
-        for key in test:
-            f.write('<top>\n<num>' + str(key) + '</num><title>\n' + queries[key] + '\n</title>\n</top>\n')
+    writers.write_lines(output_dir + '/documents.xml',
+                        ('<DOC>\n<DOCNO>%d</DOCNO>\n<TEXT>\n%s\n</TEXT></DOC>\n' % (key,value) for key,value in documents.items()))
+    for name,subset in [('training',train),('validation',validation),('test',test)]:
+        writers.write_lines(output_dir + '/' + name + '/queries.xml',
+                            ('<top>\n<num>%d</num><title>\n%s\n</title>\n</top>\n' % (key,queries[key]) for key in subset))
+    
+    
+    
+"""Removes the tables saved in a columnar binary format by a previous build in output_dir, so that
+    the csv files of a build without --columns are not shadowed by stale tables (see matchzoo_experiment.load_table).
+    
+    Args:
+        (str) output_dir: path of the directory where the collection is stored
+                
+"""
+def remove_columnar(output_dir):
+    paths = [output_dir + '/documents.columns']
+    for name in ('training','validation','test'):
+        paths += [output_dir + '/' + name + '/' + table + '.columns' for table in ('queries','qrels','BM25.qrels')]
+    for path in paths:
+        if os.path.exists(path):
+            shutil.rmtree(path)
+    
+    
+    
+"""Saves queries, documents and qrels in a columnar binary format (see columnar.save_table),
+    memory-mapped by columnar.load_table or read in a DataFrame by columnar.load_frame:
+    
+    Args:
+        (str) output_dir: path of the directory where the collection will be stored
+        (dict) documents: output of delete_empty
+        (dict) queries: output of delete_empty
+        (qrels.Qrels) qrels: output of delete_empty
+        (list) train: output of build_train_validation_test
+        (list) validation: output of build_train_validation_test
+        (list) test: output of build_train_validation_test
+                
+"""
+def save_columnar(output_dir,documents,queries,qrels,train,validation,test):
+    columnar.save_table(output_dir + '/documents.columns',
+                        {'id_right':np.fromiter(documents,dtype=np.int64,count=len(documents)),
+                         'text_right':documents.values()})
+    for name,subset in [('training',train),('validation',validation),('test',test)]:
+        columnar.save_table(output_dir + '/' + name + '/queries.columns',
+                            {'id_left':np.array(subset,dtype=np.int64),
+                             'text_left':(queries[key] for key in subset)})
+        id_left,id_right,label = qrels.select(subset)
+        columnar.save_table(output_dir + '/' + name + '/qrels.columns',{'id_left':id_left,'id_right':id_right,'label':label})
     
     
     
@@ -321,15 +820,12 @@ def save_xml(output_dir,documents,queries,train,validation,test):
     Args:
         (str) output_dir: path of the directory where the collection will be stored
         (str) file_name: name of the file
-        (dict) qrels: output of delete_empty
+        (qrels.Qrels) qrels: output of delete_empty
         (list) subset: output of build_train_validation_test
                 
 """    
 def save_qrel(output_dir,file_name,qrels,subset):
-    with open(output_dir + '/' + file_name + 'qrels','w') as f:
-        for key in subset:
-            for elem in qrels[key]:
-                f.write(str(key) + '\t0\t' + str(elem[0]) + '\t' + str(elem[1]) + '\n')
+    trec.write_qrels(output_dir + '/' + file_name + 'qrels',*qrels.select(subset))
 
 
 
@@ -337,7 +833,7 @@ def save_qrel(output_dir,file_name,qrels,subset):
     
     Args:
         (str) output_dir: path of the directory where the collection will be stored
-        (dict) qrels: output of delete_empty
+        (qrels.Qrels) qrels: output of delete_empty
         (list) train: output of build_train_validation_test
         (list) validation: output of build_train_validation_test
         (list) test: output of build_train_validation_test
@@ -354,24 +850,15 @@ def save_all_qrel(output_dir,qrels,train,validation,test):
     Args:
         (str) output_dir: path of the directory where the collection will be stored
         (str) file_name: name of the file
-        (dict) qrels: output of delete_empty
+        (qrels.Qrels) qrels: output of delete_empty
         (list) subset: output of build_train_validation_test
                 
 """        
 def save_qrel_csv(output_dir,file_name,qrels,subset):
 
-    id_left=[]
-    id_right=[]
-    label=[]
-    for key in subset:
-        for elem in qrels[key]:
-            id_left.append(key)
-            id_right.append(elem[0])
-            label.append(elem[1])
-       
-            
-    d = {"id_left":id_left,"id_right":id_right,"label":label}
-    pd.DataFrame(data=d).to_csv(output_dir + '/' + file_name + 'qrels.csv')
+    id_left,id_right,label = qrels.select(subset)
+    writers.write_csv(output_dir + '/' + file_name + 'qrels.csv',['','id_left','id_right','label'],
+                      zip(itertools.count(),id_left.tolist(),id_right.tolist(),label.tolist()))
     
     
 
@@ -379,7 +866,7 @@ def save_qrel_csv(output_dir,file_name,qrels,subset):
     
     Args:
         (str) output_dir: path of the directory where the collection will be stored
-        (dict) qrels: output of delete_empty
+        (qrels.Qrels) qrels: output of delete_empty
         (list) train: output of build_train_validation_test
         (list) validation: output of build_train_validation_test
         (list) test: output of build_train_validation_test
@@ -400,10 +887,11 @@ def save_all_qrel_csv(output_dir,qrels,train,validation,test):
                 
 """        
 def save_BM25_res(file,results):
-    with open(file,'w') as f:
-        for key,value in results.items():
-            for i,elem in enumerate(value):
-                f.write(str(key) + ' Q0 ' + str(elem[0]) + ' ' + str(i) + ' ' + str(elem[1]) + ' BM25\n')
+    sizes = np.fromiter(map(len,results.values()),dtype=np.int64,count=len(results))
+    query_ids = np.repeat(np.fromiter(results,dtype=np.int64,count=len(results)),sizes)
+    doc_ids = np.fromiter((elem[0] for value in results.values() for elem in value),dtype=np.int64,count=sizes.sum())
+    scores = np.fromiter((elem[1] for value in results.values() for elem in value),dtype=np.float64,count=sizes.sum())
+    trec.write_run(file,query_ids,doc_ids,scores,'BM25')
     
 
 
@@ -412,36 +900,57 @@ def save_BM25_res(file,results):
     Args:
         (str) file: path of the file where the results will be saved
         (dict) results: dictionnary of BM25 results produced by evaluate_BM25_query()
-        (dict) qrels : output of delete_empty
+        (qrels.Qrels) qrels : output of delete_empty
         (bool) train: indicates whether we are building the training qrels or not
                 
 """          
 def save_BM25_qrels_dataframe(file,results,qrels,train):
-    id_left=[]
-    id_right=[]
-    label=[]
+    writers.write_csv(file,['','id_left','id_right','label'],((i,) + row for i,row in enumerate(BM25_qrels_rows(results,qrels,train))))
+
+
+
+"""Saves the top documents returned by BM25 and their relevance level in a columnar binary format (see columnar.save_table),
+    the rows are written by chunks (see columnar.save_rows):
+    
+    Args:
+        (str) path: path of the directory where the table will be saved
+        (dict) results: dictionnary of BM25 results produced by evaluate_BM25_query()
+        (qrels.Qrels) qrels : output of delete_empty
+        (bool) train: indicates whether we are building the training qrels or not
+                
+"""          
+def save_BM25_qrels_columns(path,results,qrels,train):
+    nb_rows = sum(len(list_docs) for list_docs in results.values()) + (0 if train else len(results))
+    columnar.save_rows(path,{'id_left':np.int64,'id_right':np.int64,'label':np.int8},nb_rows,BM25_qrels_rows(results,qrels,train))
+
+
+
+"""Yields the rows of the BM25 qrels: top documents returned by BM25 and their relevance level 
+    (training set), or the top documents labelled 1 and the document of the query labelled 0 (validation and test sets).
+    
+    Args:
+        (dict) results: dictionnary of BM25 results produced by evaluate_BM25_query()
+        (qrels.Qrels) qrels : output of delete_empty
+        (bool) train: indicates whether we are building the training qrels or not
+    
+    Returns:
+        (generator) rows: tuples (query_id,doc_id,label)
+                
+"""
+def BM25_qrels_rows(results,qrels,train):
     for query_id,list_docs in results.items():
-        dict_docs = {elem[0]:elem[1] for elem in qrels[query_id]}
+        doc_ids,rels = qrels.get(query_id)
+        dict_docs = dict(zip(doc_ids.tolist(),rels.tolist()))
         for elem in list_docs:
-            rel = dict_docs.get(elem[0],0)
-            id_left.append(query_id)
-            id_right.append(elem[0])
-            if train:
-                label.append(rel)
-            else:
-                label.append(1)
-        if not train:          
-            id_left.append(query_id)
-            id_right.append(query_id)      
-            label.append(0)
-    
-    d = {"id_left":id_left,"id_right":id_right,"label":label}
-    pd.DataFrame(data=d).to_csv(file)
+            yield query_id,elem[0],dict_docs.get(elem[0],0) if train else 1
+        if not train:
+            yield query_id,query_id,0
     
 
     
 
 """Evaluate a result file given a qrel file. Evaluation metrics values are saved in a json file
+(see evaluation.Evaluator to evaluate results in memory and to evaluate several runs with the same qrels)
 
 Args:
     (str) eval_path: path of the file where the evaluation metrics values will be saved
@@ -450,36 +959,69 @@ Args:
     
 """   
 def evaluate(eval_path,qrel_path,res_path):
+    Evaluator.from_file(qrel_path).evaluate(run_from_arrays(*trec.read_run(res_path)),eval_path)
+
+
+
+"""Removes stopwords and stems the tokens of documents and queries before BM25 indexing and retrieval.
+    
+    Stemming is memoized in a bounded LRU cache: a few thousand distinct tokens cover most of the tokens of the collection.
     
-    measures = {"map","ndcg_cut","recall","P"}
+    Args:
+        (str) language: language of the collection
+        (int) cache_size: maximum number of stems kept in cache
+        
+"""
+class Analyzer:
     
-    with open(qrel_path, 'r') as f_qrel:
-        qrel = pytrec_eval.parse_qrel(f_qrel)
+    def __init__(self,language,cache_size=2**20):
+        if language=='en':
+            self.stop_words = set(stopwords.words('english'))
+            self.stemmer = PorterStemmer()
         
-    evaluator = pytrec_eval.RelevanceEvaluator(qrel,measures)
+        elif language=='fr':
+            self.stop_words = set(stopwords.words('french'))
+            self.stemmer = FrenchStemmer()
+        
+        elif language=='es':
+            self.stop_words = set(stopwords.words('spanish'))
+            self.stemmer = SpanishStemmer()
+            
+        elif language=='it':
+            self.stop_words = set(stopwords.words('italian'))
+            self.stemmer = ItalianStemmer()
+        
+        self.stem = functools.lru_cache(maxsize=cache_size)(self.stemmer.stem)
+    
+    
+    
+    """Analyzes a cleaned document or query.
+    
+        Args:
+            (str) text: output of clean_docs_and_build_queries
+            
+        Returns:
+            (list) terms: stems of the tokens of the text that are not stopwords
+            
+    """
+    def analyze(self,text):
+        return [self.stem(elem) for elem in text.split(" ") if elem not in self.stop_words]
 
-    with open(res_path, 'r') as f_run:
-        run = pytrec_eval.parse_run(f_run)
 
-    all_metrics = evaluator.evaluate(run)
 
-    metrics = {'P_5': 0,
-     'P_10': 0,
-     'P_20': 0,
-     'ndcg_cut_5': 0,
-     'ndcg_cut_10': 0,
-     'ndcg_cut_20': 0,
-     'ndcg_cut_100': 0,
-     'map': 0,
-     'recall_100': 0}
 
-    nb_queries = len(all_metrics)
-    for key,values in all_metrics.items():
-        for metric in metrics:
-            metrics[metric] += values[metric]/nb_queries    
+"""Returns the analyzer of a language, analyzers are built once per process and cached.
     
-    with open(eval_path, 'w') as f:
-        json.dump(metrics, f)
+    Args:
+        (str) language: language of the collection
+        
+    Returns:
+        (Analyzer) analyzer: analyzer of the language
+        
+"""
+@functools.lru_cache(maxsize=None)
+def get_analyzer(language):
+    return Analyzer(language)
 
 
 
@@ -487,37 +1029,80 @@ def evaluate(eval_path,qrel_path,res_path):
     
     Args:
         (str) query: query
-        (rank_bm25.BM25Okapi) bm25: processed corpus
+        (bm25.BM25Index) bm25: inverted index of the corpus
         (list) doc_indexes: list of the docs ids
         (int) n: number of top documents to return 
+        (str) language: language of the query
+        (bool) pruning: indicates whether or not to use MaxScore dynamic pruning
     
     Returns:
         (list) results: sorted list of doc_ids and their scores
                 
 """       
-def run_BM25_query(query,bm25,doc_indexes,k,language):
-    
-    if language=='en':
-        stop_words = set(stopwords.words('english'))
-        stemmer = PorterStemmer()
-    
-    elif language=='fr':
-        stop_words = set(stopwords.words('french'))
-        stemmer = FrenchStemmer()
+def run_BM25_query(query,bm25,doc_indexes,k,language,pruning=False):
+    tokenized_query = get_analyzer(language).analyze(query)
+    top_k,doc_scores = bm25.top_k(tokenized_query,k,pruning)
+    results = [[doc_indexes[key],score] for key,score in zip(top_k.tolist(),doc_scores)]
+    return results
+
+
+
+"""Computes a digest of the content of the documents, saved with the BM25 index to detect that the documents changed
+    (e.g. a different --len_doc, --skip_first_sentence or --redirects) even when their ids are the same.
     
-    elif language=='es':
-        stop_words = set(stopwords.words('spanish'))
-        stemmer = SpanishStemmer()
+    Args:
+        (dict) documents: output of delete_empty
         
-    elif language=='it':
-        stop_words = set(stopwords.words('italian'))
-        stemmer = ItalianStemmer()
+    Returns:
+        (str) digest: hexadecimal sha1 of the ids and texts of the documents
+        
+"""
+def documents_digest(documents):
+    digest = hashlib.sha1()
+    for key,value in documents.items():
+        digest.update(('%d\t%s\n' % (key,value)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+
+"""Loads the BM25 index saved in the output directory if it matches the collection, builds and saves it otherwise.
     
-    tokenized_query = [stemmer.stem(elem) for elem in query.split(" ") if elem not in stop_words]
-    doc_scores = bm25.get_scores(tokenized_query)
-    top_k = np.argsort(doc_scores)[::-1][:k]
-    results = [[doc_indexes[key],doc_scores[key]] for key in top_k]
-    return results
+    Args:
+        (str) output_dir: path of the directory where the collection is stored
+        (dict) documents: output of delete_empty
+        (str) language: language of the collection
+        (bool) reuse_index: indicates whether or not to load the saved index if it was built from the same documents (see documents_digest)
+        (str) checkpoint_key: key of the checkpointed collection, the saved index is loaded if it was built from this collection
+        
+    Returns:
+        (bm25.BM25Index) bm25: inverted index of the corpus
+        
+"""
+def load_or_build_BM25_index(output_dir,documents,language,reuse_index=False,checkpoint_key=None):
+    doc_indexes = list(documents)
+    digest = None
+    if reuse_index or checkpoint_key is not None:
+        metadata = BM25Index.read_metadata(output_dir + '/BM25.index')
+        if metadata is not None:
+            same_collection = checkpoint_key is not None and metadata.get('collection') == checkpoint_key
+            if reuse_index and not same_collection:
+                digest = documents_digest(documents)
+                same_collection = metadata.get('documents') == digest
+            if same_collection and metadata.get('language') == language:
+                bm25 = BM25Index.load(output_dir + '/BM25.index')
+                if bm25.doc_indexes.tolist() == doc_indexes:
+                    print('Loaded index from',output_dir + '/BM25.index',flush=True)
+                    return bm25
+            if reuse_index:
+                print('The saved index does not match the collection, it will be rebuilt',flush=True)
+    
+    print('Building index',flush=True)
+    analyzer = get_analyzer(language)
+    bm25 = BM25Index((analyzer.analyze(value) for value in documents.values()),doc_indexes=doc_indexes)
+    if digest is None:
+        digest = documents_digest(documents)
+    bm25.save(output_dir + '/BM25.index',{'language':language,'collection':checkpoint_key,'documents':digest})
+    return bm25
 
 
 
@@ -527,64 +1112,227 @@ def run_BM25_query(query,bm25,doc_indexes,k,language):
         (str) output_dir: path of the directory where the collection will be stored
         (dict) documents: output of delete_empty
         (dict) queries: output of delete_empty
-        (dict) qrels: output of delete_empty
+        (qrels.Qrels) qrels: output of delete_empty
         (list) train: output of build_train_validation_test
         (list) validation: output of build_train_validation_test
         (list) test: output of build_train_validation_test
+        (int) k: number of documents per query saved
+        (str) language: language of the collection
+        (bool) pruning: indicates whether or not to use MaxScore dynamic pruning
+        (int) workers: number of processes used to run the queries
+        (bool) reuse_index: indicates whether or not to load the index saved in output_dir instead of building it
+        (str) checkpoint_dir: directory where the results of each set are checkpointed (if None: no checkpoints)
+        (str) checkpoint_key: key of the checkpointed collection
+        (int) batch_size: number of queries scored at once with sparse matrix products (if None: queries are scored one by one)
+        (bool) columns: indicates whether or not to also save the top documents in a columnar binary format
+        (profiling.Profiler) profiler: profiler of the stages (if None: stages are not profiled)
                 
 """
-def run_BM25_collection(output_dir,documents,queries,qrels,train,validation,test,k,language):
+def run_BM25_collection(output_dir,documents,queries,qrels,train,validation,test,k,language,pruning=False,workers=1,reuse_index=False,
+                        checkpoint_dir=None,checkpoint_key=None,batch_size=None,columns=False,profiler=None):
+    
+    if profiler is None:
+        profiler = profiling.Profiler()
+    bm25 = None
+    pool = None
+    try:
+        for name,subset,is_train in (('training',train,True),('validation',validation,False),('test',test,False)):
+            key = checkpoints.stage_key(checkpoint_key,'BM25',name,k,language,bool(batch_size))
+            results = None
+            if checkpoint_dir is not None:
+                results = checkpoints.load_stage(checkpoint_dir,'BM25.' + name,key)
+            
+            if results is None:
+                if bm25 is None:
+                    with profiler.stage('indexing',docs=len(documents)):
+                        bm25 = load_or_build_BM25_index(output_dir,documents,language,reuse_index,checkpoint_key)
+                    doc_indexes = bm25.doc_indexes.tolist()
+                    print("Running BM25",flush=True)
+                    if batch_size:
+                        bm25.weight_matrix()
+                    if workers > 1:
+                        pool = fork_pool(workers,init_BM25_worker,(bm25,doc_indexes,k,language,pruning,batch_size))
+                
+                with profiler.stage('retrieval.' + name,queries=len(subset)):
+                    results = run_BM25_queries(subset,queries,bm25,doc_indexes,k,language,
+                                               pruning=pruning,pool=pool,verbose=is_train,batch_size=batch_size)
+                if checkpoint_dir is not None:
+                    checkpoints.save_stage(checkpoint_dir,'BM25.' + name,key,results)
+            
+            with profiler.stage('save_BM25_res.' + name,queries=len(results)):
+                save_BM25_res(output_dir + '/' + name + '/BM25.res',results)
+            with profiler.stage('save_BM25_qrels_dataframe.' + name,queries=len(results)):
+                save_BM25_qrels_dataframe(output_dir + '/' + name + '/BM25.qrels.csv',results,qrels,is_train)
+            if columns:
+                with profiler.stage('save_BM25_qrels_columns.' + name,queries=len(results)):
+                    save_BM25_qrels_columns(output_dir + '/' + name + '/BM25.qrels.columns',results,qrels,is_train)
+            
+            print('Evaluating BM25 results on the',name,'set',flush=True)
+            with profiler.stage('evaluate.' + name,queries=len(results)):
+                Evaluator.from_qrels(qrels,subset).evaluate(run_from_results(results),
+                                                            output_dir + '/' + name + '/BM25.metrics.json',
+                                                            output_dir + '/' + name + '/BM25.metrics.npz')
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+
+_BM25_worker_state = None
+
+
+
+"""Initializes a BM25 worker process of a pool created by fork_pool.
+
+    The weight matrix used when batch_size is set must be built before the pool is created to be shared with the workers.
     
-    if language=='en':
-        stop_words = set(stopwords.words('english'))
-        stemmer = PorterStemmer()
+    Args:
+        (bm25.BM25Index) bm25: inverted index of the corpus
+        (list) doc_indexes: list of the docs ids
+        (int) k: number of top documents to return
+        (str) language: language of the queries
+        (bool) pruning: indicates whether or not to use MaxScore dynamic pruning
+        (int) batch_size: number of queries scored at once with sparse matrix products (if None: queries are scored one by one)
+        
+"""
+def init_BM25_worker(bm25,doc_indexes,k,language,pruning,batch_size=None):
+    global _BM25_worker_state
+    _BM25_worker_state = (bm25,doc_indexes,k,language,pruning,batch_size)
+
+
+
+"""Runs BM25 on a list of queries, one by one or by batches of batch_size queries.
     
-    elif language=='fr':
-        stop_words = set(stopwords.words('french'))
-        stemmer = FrenchStemmer()
+    Args:
+        (list) chunk: list of query texts
+        (bm25.BM25Index) bm25: inverted index of the corpus
+        (list) doc_indexes: list of the docs ids
+        (int) k: number of top documents to return
+        (str) language: language of the queries
+        (bool) pruning: indicates whether or not to use MaxScore dynamic pruning (only when queries are scored one by one)
+        (int) batch_size: number of queries scored at once with sparse matrix products (if None: queries are scored one by one)
     
-    elif language=='es':
-        stop_words = set(stopwords.words('spanish'))
-        stemmer = SpanishStemmer()
+    Returns:
+        (list) results: output of run_BM25_query for each query of the chunk
         
-    elif language=='it':
-        stop_words = set(stopwords.words('italian'))
-        stemmer = ItalianStemmer()
+"""
+def run_BM25_batch(chunk,bm25,doc_indexes,k,language,pruning=False,batch_size=None):
+    if not batch_size:
+        return [run_BM25_query(query,bm25,doc_indexes,k,language,pruning) for query in chunk]
+    
+    analyzer = get_analyzer(language)
+    results = []
+    for i in range(0,len(chunk),batch_size):
+        tokenized_queries = [analyzer.analyze(query) for query in chunk[i:i+batch_size]]
+        for top_k,doc_scores in bm25.top_k_batch(tokenized_queries,k):
+            results.append([[doc_indexes[key],score] for key,score in zip(top_k.tolist(),doc_scores)])
+    return results
+
+
+
+"""Runs BM25 on a chunk of queries inside a worker process.
     
+    Args:
+        (list) chunk: list of query texts
     
-    corpus = [] 
-    doc_indexes = []
-    for key,value in documents.items():
-        doc_indexes.append(key)
-        doc = [stemmer.stem(elem) for elem in value.split(" ") if elem not in stop_words]
-        corpus.append(value.split(" "))
-    bm25 = BM25Okapi(corpus)
+    Returns:
+        (list) results: output of run_BM25_query for each query of the chunk
+        
+"""
+def run_BM25_chunk(chunk):
+    bm25,doc_indexes,k,language,pruning,batch_size = _BM25_worker_state
+    return run_BM25_batch(chunk,bm25,doc_indexes,k,language,pruning,batch_size)
+
+
+
+"""Runs BM25 on a list of queries, sequentially or in chunks over a pool of worker processes.
     
-    print("Running BM25",flush=True)
+    Args:
+        (list) query_ids: ids of the queries to run
+        (dict) queries: output of delete_empty
+        (bm25.BM25Index) bm25: inverted index of the corpus
+        (list) doc_indexes: list of the docs ids
+        (int) k: number of top documents to return
+        (str) language: language of the queries
+        (bool) pruning: indicates whether or not to use MaxScore dynamic pruning
+        (multiprocessing.pool.Pool) pool: pool initialized with init_BM25_worker (if None: queries are run in this process)
+        (bool) verbose: indicates whether or not to print the progress
+        (int) chunk_size: number of queries sent at once to a worker
+        (int) batch_size: number of queries scored at once with sparse matrix products (if None: queries are scored one by one)
     
-    results = dict()
-    for i,elem in enumerate(train):
-        results[elem] = run_BM25_query(queries[elem],bm25,doc_indexes,k,language)
-        if i%1000==0:
-            print('Processing query',i,'/',len(train),flush=True)
-    save_BM25_res(output_dir+'/training/BM25.res',results)
-    save_BM25_qrels_dataframe(output_dir + '/training/BM25.qrels.csv',results,qrels,True)
+    Returns:
+        (dict) results: keys are queries ids (in the order of query_ids) and values are outputs of run_BM25_query
+        
+"""
+def run_BM25_queries(query_ids,queries,bm25,doc_indexes,k,language,pruning,pool=None,verbose=False,chunk_size=1000,batch_size=None):
+    chunks = [[queries[elem] for elem in query_ids[i:i+chunk_size]] for i in range(0,len(query_ids),chunk_size)]
+    if pool is None:
+        chunks_results = (run_BM25_batch(chunk,bm25,doc_indexes,k,language,pruning,batch_size) for chunk in chunks)
+    else:
+        chunks_results = pool.imap(run_BM25_chunk,chunks)
     
     results = dict()
-    for elem in validation:
-        results[elem] = run_BM25_query(queries[elem],bm25,doc_indexes,k,language)
-    save_BM25_res(output_dir+'/validation/BM25.res',results)
-    save_BM25_qrels_dataframe(output_dir + '/validation/BM25.qrels.csv',results,qrels,False)
+    for i,chunk_results in enumerate(chunks_results):
+        if verbose:
+            print('Processing query',i*chunk_size,'/',len(query_ids),flush=True)
+        for elem,result in zip(query_ids[i*chunk_size:(i+1)*chunk_size],chunk_results):
+            results[elem] = result
+    return results
+
     
-    results = dict()
-    for elem in test:
-        results[elem] = run_BM25_query(queries[elem],bm25,doc_indexes,k,language)
-    save_BM25_res(output_dir+'/test/BM25.res',results)
-    save_BM25_qrels_dataframe(output_dir + '/test/BM25.qrels.csv',results,qrels,False)
+"""Saves a collection in the formats chosen in the arguments, runs BM25 and evaluates it if asked.
+    
+    Args:
+        (argparse.Namespace) args: output of argument_parser().parse_args()
+        (tuple) collection: documents, queries, qrels, train, validation and test sets (outputs of delete_empty and build_train_validation_test)
+        (str) collection_key: key of the checkpointed collection (if None: the collection is not checkpointed)
+        (profiling.Profiler) profiler: profiler of the stages
+        
+"""
+def save_collection(args,collection,collection_key,profiler):
+    documents,queries,qrels,train,validation,test = collection
+    
+    jobs = [(save_all_qrel,args.output_dir,qrels,train,validation,test)]
+    if args.json:
+        print('Saving collection with json format',flush=True)
+        jobs.append((save_json,args.output_dir,documents,queries,train,validation,test))
+    
+    if args.xml:
+        print('Saving collection with xml format',flush=True)
+        jobs.append((save_xml,args.output_dir,documents,queries,train,validation,test))
+    
+    if args.columns:
+        print('Saving collection with columnar binary format',flush=True)
+        jobs.append((save_columnar,args.output_dir,documents,queries,qrels,train,validation,test))
+    else:
+        remove_columnar(args.output_dir)
+    
+    if args.csv or not (args.json or args.xml): 
+        print('Saving collection with csv format',flush=True)
+        jobs.append((save_csv,args.output_dir,documents,queries,train,validation,test))
 
+    if profiler.enabled:
+        for function,*function_args in jobs:
+            with profiler.stage(function.__name__,docs=len(documents),queries=len(queries)):
+                function(*function_args)
+    else:
+        writers.run_in_parallel(jobs)
     
-def main():
+    if args.bm25:
+        run_BM25_collection(args.output_dir,documents,queries,qrels,train,validation,test,args.k,args.language,
+                            args.pruning,args.workers,args.reuse_index,args.checkpoint_dir,collection_key,args.batch_size,args.columns,
+                            profiler)
+
+
+
+"""Returns the parser of the arguments of build_wikIR.py.
+    
+    Returns:
+        (argparse.ArgumentParser) parser: parser of the arguments
         
+"""
+def argument_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('-i','--input', nargs="?", type=str)
     parser.add_argument('-o','--output_dir', nargs="?", type=str)
@@ -603,79 +1351,205 @@ def main():
     parser.add_argument('-c','--lower_cased', action="store_true")
     parser.add_argument('-j','--json', action="store_true")
     parser.add_argument('-x','--xml', action="store_true")
+    parser.add_argument('--csv', action="store_true")
+    parser.add_argument('--columns', action="store_true")
     parser.add_argument('-b','--bm25', action="store_true")
+    parser.add_argument('--pruning', action="store_true")
+    parser.add_argument('--batch_size', nargs="?", type=int,default = None)
+    parser.add_argument('-w','--workers', nargs="?", type=int,default = 1)
+    parser.add_argument('--reuse_index', action="store_true")
     parser.add_argument('-r','--random_seed', nargs="?", type=int,default=27355)
-    args = parser.parse_args()
-                
-    if not os.path.exists(args.output_dir):
-        print(args.output_dir,"directory does not exist.\nCreating",args.output_dir, 'directory',flush=True)
-        os.mkdir(args.output_dir)
-        os.mkdir(args.output_dir + '/training')
-        os.mkdir(args.output_dir + '/validation')
-        os.mkdir(args.output_dir + '/test')
-    
-    random.seed(args.random_seed)
-    
-    print("Reading wikiextractor file",flush=True)
-    documents,documents_ids = read_wikiextractor(args.input,
-                                                 args.min_len_doc,
-                                                 args.max_docs)
-    print(len(documents),"documents have more than",args.min_len_doc,"tokens")
+    parser.add_argument('--streaming', action="store_true")
+    parser.add_argument('--checkpoint_dir', nargs="?", type=str, default = None)
+    parser.add_argument('--redirects', nargs="?", type=str, default = None)
+    parser.add_argument('--profile', nargs="?", type=str, default = None)
+    parser.add_argument('--profile_dir', nargs="?", type=str, default = None)
+    parser.add_argument('--trace_memory', action="store_true")
+    return parser
+
+
+
+"""Creates the output directory and its training, validation and test directories if it does not exist.
     
-    print("Building qrels",flush=True)
-    qrels = build_qrels(documents,
-                        documents_ids,
-                        args.len_doc,
-                        args.min_nb_rel_doc,
-                        args.only_first_links)
+    Args:
+        (str) output_dir: path of the directory where the collection will be stored
+        
+"""
+def create_output_dir(output_dir):
+    if not os.path.exists(output_dir):
+        print(output_dir,"directory does not exist.\nCreating",output_dir, 'directory',flush=True)
+        os.mkdir(output_dir)
+        os.mkdir(output_dir + '/training')
+        os.mkdir(output_dir + '/validation')
+        os.mkdir(output_dir + '/test')
+
+
+
+"""Computes the key of the checkpointed articles (output of read_and_clean_articles) from the arguments they depend on.
     
-    print(len(qrels),"qrels have been built",flush=True)
+    Args:
+        (argparse.Namespace) args: output of argument_parser().parse_args()
         
-    print("Cleaning queries and documents",flush=True)
-    documents,queries = clean_docs_and_build_queries(qrels,
-                                                    documents,
-                                                    args.len_doc,
-                                                    args.len_query,
-                                                    args.skip_first_sentence,
-                                                    args.title_queries,
-                                                    args.lower_cased,
-                                                    args.language)
+    Returns:
+        (str) key: output of checkpoints.stage_key
+        
+"""
+def get_articles_key(args):
+    return checkpoints.stage_key('articles',
+                                 checkpoints.file_fingerprint(args.input),
+                                 args.language,
+                                 args.len_doc,
+                                 args.len_query,
+                                 args.min_len_doc,
+                                 args.title_queries,
+                                 args.only_first_links,
+                                 args.skip_first_sentence,
+                                 args.lower_cased)
+
+
+
+"""Computes the key of the checkpointed collection (sampled documents, qrels and sets) from the key of the articles
+    and the arguments used to build the collection from them.
     
-    print('Removing empty documents and queries',flush=True)
-    documents,queries,qrels = delete_empty(documents,queries,qrels)
+    Args:
+        (argparse.Namespace) args: output of argument_parser().parse_args()
+        
+    Returns:
+        (str) key: output of checkpoints.stage_key
+        
+"""
+def get_collection_key(args):
+    return checkpoints.stage_key('collection',
+                                 get_articles_key(args),
+                                 args.max_docs,
+                                 args.min_nb_rel_doc,
+                                 args.validation_part,
+                                 args.test_part,
+                                 args.streaming,
+                                 args.random_seed,
+                                 checkpoints.file_fingerprint(args.redirects) if args.redirects else None)
+
+
+
+def main():
+        
+    args = argument_parser().parse_args()
     
-    train,validation,test = build_train_validation_test(queries,args.validation_part,args.test_part)
+    profiler = profiling.Profiler(args.profile is not None,args.profile_dir,args.trace_memory)
+                
+    create_output_dir(args.output_dir)
     
-    if args.json:
-        print('Saving collection with json format',flush=True)
-        save_json(args.output_dir,documents,queries,train,validation,test)
+    collection = None
+    collection_key = None
+    if args.checkpoint_dir:
+        collection_key = get_collection_key(args)
+        collection = checkpoints.load_stage(args.checkpoint_dir,'collection',collection_key)
     
-    elif args.xml:
-        print('Saving collection with xml format',flush=True)
-        save_xml(args.output_dir,documents,queries,train,validation,test)
+    if collection is None:
+        random.seed(args.random_seed)
+        
+        redirects = None
+        if args.redirects:
+            redirects = read_redirects(args.redirects)
+            print(len(redirects),"redirects have been read",flush=True)
+    
+        if args.checkpoint_dir:
+            articles_key = get_articles_key(args)
+            articles = checkpoints.load_stage(args.checkpoint_dir,'articles',articles_key)
+            if articles is None:
+                print("Reading, extracting links and cleaning all the articles",flush=True)
+                with profiler.stage('read_and_clean_articles'):
+                    articles = read_and_clean_articles(args.input,
+                                                       args.min_len_doc,
+                                                       args.len_doc,
+                                                       args.len_query,
+                                                       args.only_first_links,
+                                                       args.skip_first_sentence,
+                                                       args.title_queries,
+                                                       args.lower_cased,
+                                                       args.language,
+                                                       args.workers)
+                    profiling.add_items(docs=len(articles[0]))
+                checkpoints.save_stage(args.checkpoint_dir,'articles',articles_key,articles)
+            with profiler.stage('build_collection_from_articles',docs=len(articles[0])):
+                documents,queries,qrels = build_collection_from_articles(*articles,
+                                                                         args.max_docs,
+                                                                         args.min_nb_rel_doc,
+                                                                         args.streaming,
+                                                                         redirects)
+            del articles
+        elif args.workers > 1:
+            print("Reading, building qrels and cleaning with",args.workers,"processes",flush=True)
+            with profiler.stage('build_collection_sharded'):
+                documents,queries,qrels = build_collection_sharded(args.input,
+                                                                   args.min_len_doc,
+                                                                   args.max_docs,
+                                                                   args.len_doc,
+                                                                   args.len_query,
+                                                                   args.min_nb_rel_doc,
+                                                                   args.only_first_links,
+                                                                   args.skip_first_sentence,
+                                                                   args.title_queries,
+                                                                   args.lower_cased,
+                                                                   args.language,
+                                                                   args.streaming,
+                                                                   args.workers,
+                                                                   redirects)
+                profiling.add_items(docs=len(documents),queries=len(queries))
+        else:
+            print("Reading wikiextractor file",flush=True)
+            with profiler.stage('read_wikiextractor'):
+                if args.streaming:
+                    documents,documents_ids = read_wikiextractor_stream(args.input,
+                                                                        args.min_len_doc,
+                                                                        args.max_docs,
+                                                                        args.len_doc,
+                                                                        args.only_first_links,
+                                                                        args.language)
+                else:
+                    documents,documents_ids = read_wikiextractor(args.input,
+                                                                 args.min_len_doc,
+                                                                 args.max_docs)
+                profiling.add_items(docs=len(documents))
+            print(len(documents),"documents have more than",args.min_len_doc,"tokens")
+    
+            print("Building qrels",flush=True)
+            with profiler.stage('build_qrels',docs=len(documents)):
+                qrels = build_qrels(documents,
+                                    documents_ids,
+                                    args.len_doc,
+                                    args.min_nb_rel_doc,
+                                    args.only_first_links,
+                                    redirects)
+                profiling.add_items(queries=len(qrels))
+            print(len(qrels),"qrels have been built",flush=True)
+        
+            print("Cleaning queries and documents",flush=True)
+            with profiler.stage('clean_docs_and_build_queries',docs=len(documents)):
+                documents,queries = clean_docs_and_build_queries(qrels,
+                                                                documents,
+                                                                args.len_doc,
+                                                                args.len_query,
+                                                                args.skip_first_sentence,
+                                                                args.title_queries,
+                                                                args.lower_cased,
+                                                                args.language)
+    
+        print('Removing empty documents and queries',flush=True)
+        with profiler.stage('delete_empty',docs=len(documents),queries=len(queries)):
+            documents,queries,qrels = delete_empty(documents,queries,qrels)
+    
+        train,validation,test = build_train_validation_test(queries,args.validation_part,args.test_part)
+        
+        collection = (documents,queries,qrels,train,validation,test)
+        if args.checkpoint_dir:
+            checkpoints.save_stage(args.checkpoint_dir,'collection',collection_key,collection)
     
-    else: 
-        print('Saving collection with csv format',flush=True)
-        save_csv(args.output_dir,documents,queries,train,validation,test)
-
-    save_all_qrel(args.output_dir,qrels,train,validation,test)
+    save_collection(args,collection,collection_key,profiler)
     
-    if args.bm25:
-        print('Building index',flush=True)
-        run_BM25_collection(args.output_dir,documents,queries,qrels,train,validation,test,args.k,args.language)
-
-        print('Evaluating BM25 results',flush=True)
-        evaluate(args.output_dir + '/training/BM25.metrics.json',
-                 args.output_dir + '/training/qrels',
-                 args.output_dir + '/training/BM25.res')
-
-        evaluate(args.output_dir + '/validation/BM25.metrics.json',
-                 args.output_dir + '/validation/qrels',
-                 args.output_dir + '/validation/BM25.res')
-
-        evaluate(args.output_dir + '/test/BM25.metrics.json',
-                 args.output_dir + '/test/qrels',
-                 args.output_dir + '/test/BM25.res')
+    if args.profile:
+        profiler.save(args.profile,vars(args))
+        print('Profile saved in',args.profile,flush=True)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,102 @@
+import os
+import json
+import pickle
+import hashlib
+
+
+
+"""Returns a fingerprint of a file that changes when the file is modified, without reading it.
+
+    Args:
+        (str) path: path of the file
+
+    Returns:
+        (list) fingerprint: absolute path, size and modification time of the file
+
+"""
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return [os.path.abspath(path),stat.st_size,stat.st_mtime_ns]
+
+
+
+"""Computes the key of a stage from everything its output depends on.
+
+    Args:
+        (list) params: json serializable values (parameters of the stage, keys of the previous stages, file fingerprints)
+
+    Returns:
+        (str) key: hexadecimal hash of the parameters
+
+"""
+def stage_key(*params):
+    return hashlib.sha1(json.dumps(params,sort_keys=True).encode('utf-8')).hexdigest()
+
+
+
+"""Loads the output of a stage saved by save_stage.
+
+    Args:
+        (str) checkpoint_dir: directory where the stages are saved
+        (str) name: name of the stage
+        (str) key: output of stage_key
+
+    Returns:
+        (object) data: output of the stage (None if there is no checkpoint of this stage for this key)
+
+"""
+def load_stage(checkpoint_dir,name,key):
+    path = checkpoint_dir + '/' + name + '.' + key + '.pkl'
+    if not os.path.exists(path):
+        return None
+    print('Loading',name,'from',path,flush=True)
+    os.utime(path)
+    with open(path,'rb') as f:
+        return pickle.load(f)
+
+
+
+"""Saves the output of a stage. The file is written under a temporary name and then renamed,
+    so that a build interrupted while saving never leaves a truncated checkpoint.
+
+    Args:
+        (str) checkpoint_dir: directory where the stages are saved
+        (str) name: name of the stage
+        (str) key: output of stage_key
+        (object) data: output of the stage
+        (int) max_size: maximum size in bytes of the saved stages, see evict (if None: no limit)
+
+"""
+def save_stage(checkpoint_dir,name,key,data,max_size=None):
+    if not os.path.exists(checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+    path = checkpoint_dir + '/' + name + '.' + key + '.pkl'
+    with open(path + '.tmp','wb') as f:
+        pickle.dump(data,f,protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp',path)
+    if max_size is not None:
+        evict(checkpoint_dir,max_size,keep=os.path.basename(path))
+
+
+
+"""Deletes the least recently used stages (saved or loaded) until the stages saved in checkpoint_dir fit in max_size bytes.
+
+    Args:
+        (str) checkpoint_dir: directory where the stages are saved
+        (int) max_size: maximum size in bytes of the saved stages
+        (str) keep: file name of a stage that is never deleted (e.g. the stage that has just been saved)
+
+"""
+def evict(checkpoint_dir,max_size,keep=None):
+    entries = [(entry.stat().st_mtime_ns,entry.stat().st_size,entry.path) for entry in os.scandir(checkpoint_dir)
+               if entry.name.endswith('.pkl') and entry.name != keep]
+    entries.sort()
+    size = sum(entry[1] for entry in entries)
+    if keep is not None:
+        size += os.path.getsize(os.path.join(checkpoint_dir,keep))
+    for _,entry_size,path in entries:
+        if size <= max_size:
+            break
+        print('Evicting',path,flush=True)
+        os.remove(path)
+        size -= entry_size
@@ -0,0 +1,160 @@
+import os
+import json
+import itertools
+import numpy as np
+import pandas as pd
+import writers
+
+
+
+"""Saves a table in a columnar binary format: one file per column in the directory path.
+
+    Numeric columns are saved as .npy files with their dtype (e.g. int64 ids, int8 labels).
+    Text columns are saved as the concatenation of their utf-8 encoded values (name.bin)
+    and the boundaries of each value (name.offsets.npy), and are written while they are produced.
+
+    Args:
+        (str) path: path of the directory of the table
+        (dict) columns: keys are names of the columns and values are numpy arrays or iterables of strings
+
+"""
+def save_table(path,columns):
+    if not os.path.exists(path):
+        os.makedirs(path)
+    for name,values in columns.items():
+        if isinstance(values,np.ndarray):
+            np.save(path + '/' + name + '.npy',values)
+        else:
+            offsets = [0]
+            end = 0
+            with open(path + '/' + name + '.bin','wb',buffering=writers.BUFFER_SIZE) as f:
+                for value in values:
+                    end += f.write(value.encode('utf-8'))
+                    offsets.append(end)
+            np.save(path + '/' + name + '.offsets.npy',np.array(offsets,dtype=np.int64))
+    with open(path + '/columns.json','w') as f:
+        json.dump(list(columns),f)
+
+
+
+"""Saves a table of numeric columns whose rows are produced by an iterable, in the format of save_table.
+
+    The rows are written by chunks in memory-mapped .npy files, so that only one chunk of rows is kept in memory.
+
+    Args:
+        (str) path: path of the directory of the table
+        (dict) dtypes: keys are names of the columns and values are their numpy dtypes
+        (int) nb_rows: number of rows produced by rows
+        (iterable) rows: tuples of values in the order of dtypes
+        (int) chunk_size: number of rows written at once
+
+"""
+def save_rows(path,dtypes,nb_rows,rows,chunk_size=2**16):
+    if not os.path.exists(path):
+        os.makedirs(path)
+    columns = [np.lib.format.open_memmap(path + '/' + name + '.npy',mode='w+',dtype=dtype,shape=(nb_rows,))
+               for name,dtype in dtypes.items()]
+    rows = iter(rows)
+    start = 0
+    while True:
+        chunk = list(itertools.islice(rows,chunk_size))
+        if not chunk:
+            break
+        end = start + len(chunk)
+        if end > nb_rows:
+            raise ValueError('More than ' + str(nb_rows) + ' rows saved in ' + path)
+        for i,column in enumerate(columns):
+            column[start:end] = [row[i] for row in chunk]
+        start = end
+    if start != nb_rows:
+        raise ValueError(str(start) + ' rows saved in ' + path + ' instead of ' + str(nb_rows))
+    for column in columns:
+        column.flush()
+    with open(path + '/columns.json','w') as f:
+        json.dump(list(dtypes),f)
+
+
+
+"""Text column of a table loaded by load_table, values are decoded when they are accessed.
+
+    Args:
+        (numpy.ndarray) data: utf-8 encoded values
+        (numpy.ndarray) offsets: boundaries of each value in data
+
+"""
+class TextColumn:
+
+    def __init__(self,data,offsets):
+        self.data = data
+        self.offsets = offsets
+
+
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+
+    def __getitem__(self,i):
+        return self.data[self.offsets[i]:self.offsets[i+1]].tobytes().decode('utf-8')
+
+
+
+    def __iter__(self):
+        offsets = self.offsets.tolist()
+        for start,end in zip(offsets,offsets[1:]):
+            yield self.data[start:end].tobytes().decode('utf-8')
+
+
+
+    def tolist(self):
+        return list(self)
+
+
+
+"""Loads a table saved by save_table.
+
+    Args:
+        (str) path: path of the directory of the table
+        (bool) mmap: indicates whether or not to memory-map the columns instead of reading them
+
+    Returns:
+        (dict) columns: keys are names of the columns and values are numpy arrays or TextColumn
+
+"""
+def load_table(path,mmap=True):
+    mmap_mode = 'r' if mmap else None
+    with open(path + '/columns.json','r') as f:
+        names = json.load(f)
+    columns = dict()
+    for name in names:
+        if os.path.exists(path + '/' + name + '.bin'):
+            if mmap and os.path.getsize(path + '/' + name + '.bin') > 0:
+                data = np.memmap(path + '/' + name + '.bin',dtype=np.uint8,mode='r')
+            else:
+                data = np.fromfile(path + '/' + name + '.bin',dtype=np.uint8)
+            columns[name] = TextColumn(data,np.load(path + '/' + name + '.offsets.npy',mmap_mode=mmap_mode))
+        else:
+            columns[name] = np.load(path + '/' + name + '.npy',mmap_mode=mmap_mode)
+    return columns
+
+
+
+"""Loads a table saved by save_table in a pandas DataFrame. The columns are read in memory (the DataFrame owns its data),
+    use load_table to memory-map them.
+
+    Args:
+        (str) path: path of the directory of the table
+        (str) index_col: name of the column used as index (if None: default index)
+
+    Returns:
+        (pandas.DataFrame) frame: the table
+
+"""
+def load_frame(path,index_col=None):
+    columns = {name:(values.tolist() if isinstance(values,TextColumn) else np.asarray(values))
+               for name,values in load_table(path,mmap=False).items()}
+    frame = pd.DataFrame(columns)
+    if index_col is not None:
+        frame = frame.set_index(index_col)
+    return frame
@@ -1,10 +1,57 @@
 import os
 import json
 import argparse
-import scipy.stats
-import pytrec_eval
+import functools
+import trec
+import evaluation
 import matchzoo as mz
 
+
+
+"""Builds the evaluator of a qrel file, once.
+
+    Args:
+        (str) qrel_path: path of the qrel file
+        (tuple) measures: measures computed by pytrec_eval
+        
+    Returns:
+        (evaluation.Evaluator) evaluator: evaluator of the qrels
+
+"""
+@functools.lru_cache(maxsize=None)
+def get_evaluator(qrel_path,measures):
+    return evaluation.Evaluator.from_file(qrel_path,set(measures))
+
+
+
+"""Loads the metrics of each query of a run: from the table saved when the run was evaluated, or by evaluating
+    the run file when there is no such table (e.g. BM25 results of the downloadable datasets) or when it does not contain
+    all the metrics (e.g. BM25 tables computed with the default measures of build_wikIR.py).
+
+    Args:
+        (str) prefix: path of the run without extension (prefix + '.res' or prefix + '.res.gz' is the run file)
+        (str) qrel_path: path of the qrel file
+        (list) measures: measures computed by pytrec_eval in addition to evaluation.MEASURES
+        (list) print_measures: names of the metrics to load
+        
+    Returns:
+        (numpy.ndarray) query_ids: ids of the evaluated queries
+        (numpy.ndarray) values: values[i,j] is the metric print_measures[j] of the query query_ids[i]
+
+"""
+def load_metrics(prefix,qrel_path,measures,print_measures):
+    if os.path.exists(prefix + '.metrics.npz'):
+        query_ids,saved_measures,values = evaluation.load_per_query(prefix + '.metrics.npz')
+        if set(print_measures) <= set(saved_measures):
+            return query_ids,values[:,[saved_measures.index(measure) for measure in print_measures]]
+    
+    res_path = prefix + '.res' if os.path.exists(prefix + '.res') else prefix + '.res.gz'
+    run = evaluation.run_from_arrays(*trec.read_run(res_path))
+    query_ids,all_measures,values = get_evaluator(qrel_path,tuple(sorted(evaluation.MEASURES | set(measures)))).evaluate_per_query(run)
+    return query_ids,values[:,[all_measures.index(measure) for measure in print_measures]]
+
+
+
 def main():
 
     parser = argparse.ArgumentParser()
@@ -15,23 +62,15 @@ def main():
 
     IR_models = [mz.models.list_available()[i] for i in config["index_mz_models"]]
 
-    with open(config["collection_path"] + '/test/qrels', 'r') as f_qrel:
-        qrel = pytrec_eval.parse_qrel(f_qrel)
+    qrel_path = config["collection_path"] + '/test/qrels'
+    print_measures = config["print_measures"]
 
-    evaluator = pytrec_eval.RelevanceEvaluator(qrel, set(config["measures"]))
-
-    bm25_res = json.load(open(config["collection_path"] + '/test/' + 'BM25.metrics.json','r'))
-
-    with open(config["collection_path"] + '/test/' + 'BM25.res', 'r') as f_run:
-        bm25_run = pytrec_eval.parse_run(f_run)
-
-    bm25_results = evaluator.evaluate(bm25_run)
+    bm25_query_ids,bm25_values = load_metrics(config["collection_path"] + '/test/BM25',qrel_path,config["measures"],print_measures)
 
     _ = ""
 
-    for key,value in bm25_res.items():
-        if key in config["print_measures"]:
-            _ += str(value)[:6] + " & "
+    for value in bm25_values.mean(axis=0).tolist():
+        _ += str(value)[:6] + " & "
 
     print('BM25 & ' + _[:-2] + '\\\\')
 
@@ -55,34 +94,27 @@ def main():
                 test_res = json.load(open(test_path + '/' + best_model,'r'))
                 all_res[model_class.__name__] = [best_model,test_res]
 
-                with open(config["collection_path"] + '/test/' + model_class.__name__ + '/' + best_model[:-12] + 'res', 'r') as f_run:
-                    run = pytrec_eval.parse_run(f_run)
-
-                results = evaluator.evaluate(run)
+                query_ids,values = load_metrics(test_path + '/' + best_model[:-13],qrel_path,config["measures"],print_measures)
 
-                query_ids = list(set(bm25_results.keys()) & set(results.keys()))
+                statistics,p_values = evaluation.paired_t_test(bm25_query_ids,bm25_values,query_ids,values)
 
                 _ = ""
 
-                for key,value in test_res.items():
-                    if key in config["print_measures"]:
-                        bm25_scores = [bm25_results[query_id][key] for query_id in query_ids]
-                        scores = [results[query_id][key] for query_id in query_ids]
-                        test = scipy.stats.ttest_rel(bm25_scores, scores)
-                        _ += str(value)[:6]
-                        if test[0] < 0:
-                            if test[1] < 0.01/len(config["print_measures"]):
-                                _ += "\\textsuperscript{\\textbf{++}}"
-                            elif test[1] < 0.05/len(config["print_measures"]):
-                                _ += "\\textsuperscript{\\textbf{+}}"
-
-                        else:
-                            if test[1] < 0.01/len(config["print_measures"]):
-                                _ += "\\textsuperscript{\\textbf{-\,-}}"
-                            elif test[1] < 0.05/len(config["print_measures"]):
-                                _ += "\\textsuperscript{\\textbf{-}}"
-
-                        _ +=  " & "
+                for value,statistic,p_value in zip(values.mean(axis=0).tolist(),statistics.tolist(),p_values.tolist()):
+                    _ += str(value)[:6]
+                    if statistic < 0:
+                        if p_value < 0.01/len(print_measures):
+                            _ += "\\textsuperscript{\\textbf{++}}"
+                        elif p_value < 0.05/len(print_measures):
+                            _ += "\\textsuperscript{\\textbf{+}}"
+
+                    else:
+                        if p_value < 0.01/len(print_measures):
+                            _ += "\\textsuperscript{\\textbf{-\,-}}"
+                        elif p_value < 0.05/len(print_measures):
+                            _ += "\\textsuperscript{\\textbf{-}}"
+
+                    _ +=  " & "
 
                 print(model_class.__name__ + ' & ' + _[:-2] + '\\\\' )
 
@@ -0,0 +1,195 @@
+import os
+import json
+import hashlib
+import numpy as np
+import columnar
+import checkpoints
+import writers
+
+
+
+"""Version of the table produced by convert_embeddings, tables of older versions are converted again"""
+FORMAT_VERSION = 2
+
+
+
+"""Hashes a term into a signed 64 bits integer, used to look terms up without decoding the terms of the table.
+
+    Args:
+        (str) term: the term
+
+    Returns:
+        (int) hash: hash of the term
+
+"""
+def term_hash(term):
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'),digest_size=8).digest(),'little',signed=True)
+
+
+
+"""Converts a word embeddings text file (fastText or GloVe format: one word followed by its vector per line,
+    with or without a first line giving the number of words and the dimension) into a columnar table
+    (see columnar.save_table) with a text column term, an int64 column term_hash (see term_hash) and a float32 matrix column vector.
+    The file is read line by line and the vectors are written directly into the memory-mapped matrix.
+
+    Args:
+        (str) file: path of the embeddings text file
+        (str) path: path of the directory of the table
+
+"""
+def convert_embeddings(file,path):
+    with open(file,'r',encoding='utf-8',errors='replace') as f:
+        fields = f.readline().rstrip('\n').split(' ')
+        if len(fields) == 2:
+            nb_words,dim = int(fields[0]),int(fields[1])
+            header = True
+        else:
+            dim = len(fields) - 1
+            nb_words = 1 + sum(1 for _ in f)
+            header = False
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+    vectors = np.lib.format.open_memmap(path + '/vector.npy',mode='w+',dtype=np.float32,shape=(nb_words,dim))
+    offsets = [0]
+    hashes = []
+    end = 0
+    with open(file,'r',encoding='utf-8',errors='replace') as f, open(path + '/term.bin','wb',buffering=writers.BUFFER_SIZE) as f_terms:
+        if header:
+            f.readline()
+        for line in f:
+            fields = line.rstrip(' \n').split(' ')
+            if len(fields) <= dim or len(offsets) > nb_words:
+                continue
+            vectors[len(offsets)-1] = np.array(fields[-dim:],dtype=np.float32)
+            term = ' '.join(fields[:-dim])
+            end += f_terms.write(term.encode('utf-8'))
+            offsets.append(end)
+            hashes.append(term_hash(term))
+
+    nb_words = len(offsets) - 1
+    if nb_words < len(vectors):
+        np.save(path + '/vector.tmp.npy',vectors[:nb_words])
+        del vectors
+        os.replace(path + '/vector.tmp.npy',path + '/vector.npy')
+    else:
+        vectors.flush()
+        del vectors
+    np.save(path + '/term.offsets.npy',np.array(offsets,dtype=np.int64))
+    np.save(path + '/term_hash.npy',np.array(hashes,dtype=np.int64))
+    with open(path + '/columns.json','w') as f:
+        json.dump(['term','term_hash','vector'],f)
+
+
+
+"""Word embeddings memory-mapped from a table produced by convert_embeddings.
+    Compatible with matchzoo.embedding.Embedding: build_matrix only reads the vectors and decodes the terms of the vocabulary.
+
+    Args:
+        (str) path: path of the directory of the table
+
+"""
+class Embedding:
+
+    def __init__(self,path):
+        table = columnar.load_table(path)
+        self.terms = table['term']
+        self.vectors = table['vector']
+        self.hashes = np.asarray(table['term_hash'])
+        self.hash_order = np.argsort(self.hashes,kind='stable')
+        self.sorted_hashes = self.hashes[self.hash_order]
+
+
+
+    @property
+    def input_dim(self):
+        return self.vectors.shape[0]
+
+
+
+    @property
+    def output_dim(self):
+        return self.vectors.shape[1]
+
+
+
+    """Finds the rows of the terms of a vocabulary, by their hashes: only the terms whose hash matches are decoded.
+        When a term appears several times in the table, its last row is used (like matchzoo.embedding.Embedding).
+
+        Args:
+            (dict) term_index: keys are terms and values are their index in the matrix
+
+        Returns:
+            (list) indexes: indexes of the terms found in the table
+            (list) rows: row of each of these terms in the table
+
+    """
+    def lookup(self,term_index):
+        terms = list(term_index)
+        hashes = np.array([term_hash(term) for term in terms],dtype=np.int64)
+        starts = np.searchsorted(self.sorted_hashes,hashes,side='left').tolist()
+        ends = np.searchsorted(self.sorted_hashes,hashes,side='right').tolist()
+        indexes = []
+        rows = []
+        for term,start,end in zip(terms,starts,ends):
+            matches = [row for row in self.hash_order[start:end].tolist() if self.terms[row] == term]
+            if matches:
+                indexes.append(term_index[term])
+                rows.append(max(matches))
+        return indexes,rows
+
+
+
+    """Builds the embedding matrix of a vocabulary like matchzoo.embedding.Embedding.build_matrix: the matrix has
+        len(term_index) rows, every element is first drawn with initializer and the rows of the terms of the table are
+        replaced by their vectors.
+
+        Args:
+            (dict) term_index: keys are terms and values are their index in the matrix
+            (function) initializer: returns the initial value of one element of the matrix
+                                    (if None: uniform in [-0.2,0.2], the same draws as the default initializer of matchzoo)
+
+        Returns:
+            (numpy.ndarray) matrix: embedding matrix
+
+    """
+    def build_matrix(self,term_index,initializer=None):
+        shape = (len(term_index),self.output_dim)
+        if initializer is None:
+            matrix = np.random.uniform(-0.2,0.2,size=shape)
+        else:
+            matrix = np.empty(shape)
+            for index in np.ndindex(*shape):
+                matrix[index] = initializer()
+
+        indexes,rows = self.lookup(term_index)
+        if indexes:
+            matrix[indexes] = self.vectors[np.array(rows)]
+        return matrix
+
+
+
+"""Loads word embeddings from a text file. The file is converted by convert_embeddings the first time it is loaded,
+    in the directory file + '.columns', and the converted table is memory-mapped afterwards (it is converted again when
+    the text file or FORMAT_VERSION changes).
+
+    Args:
+        (str) file: path of the embeddings text file
+
+    Returns:
+        (Embedding) embedding: word embeddings
+
+"""
+def load_embeddings(file):
+    path = file + '.columns'
+    fingerprint = checkpoints.file_fingerprint(file) + [FORMAT_VERSION]
+    source = None
+    if os.path.exists(path + '/source.json'):
+        with open(path + '/source.json','r') as f:
+            source = json.load(f)
+    if source != fingerprint:
+        print('Converting',file,'to',path,flush=True)
+        convert_embeddings(file,path)
+        with open(path + '/source.json','w') as f:
+            json.dump(fingerprint,f)
+    return Embedding(path)
@@ -0,0 +1,223 @@
+import json
+import numpy as np
+import scipy.stats
+import trec
+import pytrec_eval
+
+
+
+"""Measures computed by pytrec_eval"""
+MEASURES = {"map","ndcg_cut","recall","P"}
+
+"""Metrics saved in the metrics files"""
+METRICS = ['P_5','P_10','P_20','ndcg_cut_5','ndcg_cut_10','ndcg_cut_20','ndcg_cut_100','map','recall_100']
+
+
+
+"""Converts BM25 results to a pytrec_eval run.
+
+    Args:
+        (dict) results: keys are queries ids and values are lists of pairs (doc_id,score), output of run_BM25_collection
+
+    Returns:
+        (dict) run: keys are queries ids and values are dicts of documents ids and scores (ids are strings)
+
+"""
+def run_from_results(results):
+    return {str(query_id):{str(doc_id):float(score) for doc_id,score in value} for query_id,value in results.items()}
+
+
+
+"""Converts scores stored in arrays to a pytrec_eval run.
+
+    Args:
+        (numpy.ndarray) query_ids: query of each score
+        (numpy.ndarray) doc_ids: document of each score
+        (numpy.ndarray) scores: scores
+
+    Returns:
+        (dict) run: keys are queries ids and values are dicts of documents ids and scores (ids are strings)
+
+"""
+def run_from_arrays(query_ids,doc_ids,scores):
+    run = dict()
+    for query_id,doc_id,score in zip(query_ids.tolist(),doc_ids.tolist(),scores.tolist()):
+        run.setdefault(str(query_id),dict())[str(doc_id)] = score
+    return run
+
+
+
+"""Evaluates runs of a set of queries. The qrels are parsed once and runs are evaluated from memory.
+
+    Args:
+        (dict) qrel: keys are queries ids and values are dicts of documents ids and relevance levels (ids are strings)
+        (set) measures: measures computed by pytrec_eval
+
+"""
+class Evaluator:
+
+    def __init__(self,qrel,measures=MEASURES):
+        self.evaluator = pytrec_eval.RelevanceEvaluator(qrel,measures)
+
+
+
+    """Builds the evaluator of a qrel file in the TREC format.
+
+        Args:
+            (str) qrel_path: path of the qrel file (compressed with gzip if it ends with .gz)
+            (set) measures: measures computed by pytrec_eval
+
+        Returns:
+            (Evaluator) evaluator: evaluator of the qrels
+
+    """
+    @classmethod
+    def from_file(cls,qrel_path,measures=MEASURES):
+        qrel = dict()
+        for query_id,doc_id,rel in zip(*[column.tolist() for column in trec.read_qrels(qrel_path)]):
+            qrel.setdefault(str(query_id),dict())[str(doc_id)] = rel
+        return cls(qrel,measures)
+
+
+
+    """Builds the evaluator of a subset of queries.
+
+        Args:
+            (qrels.Qrels) qrels: relevance judgments
+            (list) subset: ids of the queries
+
+        Returns:
+            (Evaluator) evaluator: evaluator of the qrels of the subset
+
+    """
+    @classmethod
+    def from_qrels(cls,qrels,subset):
+        qrel = dict()
+        for query_id in subset:
+            doc_ids,rels = qrels.get(query_id)
+            qrel[str(query_id)] = dict(zip(map(str,doc_ids.tolist()),rels.tolist()))
+        return cls(qrel)
+
+
+
+    """Evaluates a run and returns the metrics of each query.
+
+        Args:
+            (dict) run: output of run_from_results or run_from_arrays
+
+        Returns:
+            (numpy.ndarray) query_ids: ids of the evaluated queries
+            (list) measures: names of the metrics
+            (numpy.ndarray) values: values[i,j] is the metric measures[j] of the query query_ids[i]
+
+    """
+    def evaluate_per_query(self,run):
+        all_metrics = self.evaluator.evaluate(run)
+        measures = sorted(next(iter(all_metrics.values()))) if all_metrics else list(METRICS)
+        query_ids = np.array([int(query_id) for query_id in all_metrics],dtype=np.int64)
+        values = np.array([[metrics[measure] for measure in measures] for metrics in all_metrics.values()],dtype=np.float64)
+        return query_ids,measures,values.reshape(len(query_ids),len(measures))
+
+
+
+    """Evaluates a run and returns the mean of the metrics over the queries.
+
+        Args:
+            (dict) run: output of run_from_results or run_from_arrays
+            (str) eval_path: path of the json file where the metrics are saved (if None: the metrics are not saved)
+            (str) per_query_path: path of the .npz file where the metrics of each query are saved, see save_per_query (if None: they are not saved)
+
+        Returns:
+            (dict) metrics: keys are the names of the metrics and values are their mean
+
+    """
+    def evaluate(self,run,eval_path=None,per_query_path=None):
+        query_ids,measures,values = self.evaluate_per_query(run)
+        if per_query_path is not None:
+            save_per_query(per_query_path,query_ids,measures,values)
+
+        means = mean_metrics(measures,values)
+        metrics = {metric:means[metric] for metric in METRICS}
+
+        if eval_path is not None:
+            with open(eval_path,'w') as f:
+                json.dump(metrics,f)
+        return metrics
+
+
+
+"""Saves the metrics of each query in a single numpy file (.npz): the query ids, the names of the metrics
+    and a float64 table with one row per query and one column per metric.
+
+    Args:
+        (str) path: path of the file (should end with .npz)
+        (numpy.ndarray) query_ids: output of Evaluator.evaluate_per_query
+        (list) measures: output of Evaluator.evaluate_per_query
+        (numpy.ndarray) values: output of Evaluator.evaluate_per_query
+
+"""
+def save_per_query(path,query_ids,measures,values):
+    with open(path,'wb') as f:
+        np.savez(f,query_ids=query_ids,measures=np.array(measures,dtype=str),values=values)
+
+
+
+"""Loads the metrics of each query saved by save_per_query.
+
+    Args:
+        (str) path: path of the file
+        (list) measures: names of the metrics to load (if None: all the metrics of the file)
+
+    Returns:
+        (numpy.ndarray) query_ids: ids of the evaluated queries
+        (list) measures: names of the metrics
+        (numpy.ndarray) values: values[i,j] is the metric measures[j] of the query query_ids[i]
+
+"""
+def load_per_query(path,measures=None):
+    with np.load(path) as table:
+        query_ids = table['query_ids']
+        saved_measures = table['measures'].tolist()
+        values = table['values']
+    if measures is None:
+        return query_ids,saved_measures,values
+    missing = [measure for measure in measures if measure not in saved_measures]
+    if missing:
+        raise KeyError('Metrics ' + ', '.join(missing) + ' are not saved in ' + path)
+    return query_ids,list(measures),values[:,[saved_measures.index(measure) for measure in measures]]
+
+
+
+"""Computes the mean of each metric over the queries.
+
+    Args:
+        (list) measures: names of the metrics
+        (numpy.ndarray) values: metrics of each query (queries x metrics)
+
+    Returns:
+        (dict) means: keys are names of the metrics and values are their mean
+
+"""
+def mean_metrics(measures,values):
+    means = values.mean(axis=0) if len(values) else np.zeros(len(measures))
+    return dict(zip(measures,means.tolist()))
+
+
+
+"""Paired Student t-tests between two systems on the queries evaluated for both, for all the metrics at once.
+
+    Args:
+        (numpy.ndarray) query_ids_a: query ids of the first system
+        (numpy.ndarray) values_a: metrics of each query of the first system (queries x metrics)
+        (numpy.ndarray) query_ids_b: query ids of the second system
+        (numpy.ndarray) values_b: metrics of each query of the second system (same metrics, in the same order)
+
+    Returns:
+        (numpy.ndarray) statistics: t statistic of each metric (negative when the second system is better)
+        (numpy.ndarray) p_values: two-sided p-value of each metric
+
+"""
+def paired_t_test(query_ids_a,values_a,query_ids_b,values_b):
+    _,rows_a,rows_b = np.intersect1d(query_ids_a,query_ids_b,return_indices=True)
+    statistics,p_values = scipy.stats.ttest_rel(values_a[rows_a],values_b[rows_b],axis=0)
+    return np.asarray(statistics),np.asarray(p_values)
@@ -1,18 +1,69 @@
 import os
-import sys 
-import csv
 import json
 import argparse
-import build_wikIR
+import functools
+import concurrent.futures
+import trec
+import columnar
+import embeddings
+import checkpoints
+import evaluation
+import numpy as np
 import pandas as pd
 import matchzoo as mz
 
 
 
+"""Parameters of the preprocessors of all the models"""
+PREPROCESSING_PARAMS = {'fixed_length_left':10,
+                        'fixed_length_right':200,
+                        'filter_mode':'tf',
+                        'filter_low_freq':5,
+                        'filter_high_freq':float('inf'),
+                        'remove_stop_words':True}
+
+
+
+"""Returns the path of the file that changes when a table of the collection is saved again.
+
+    Args:
+        (str) path: path of the table without extension
+        
+    Returns:
+        (str) file: path of the file
+
+"""
+def table_file(path):
+    if os.path.exists(path + '.columns'):
+        return path + '.columns/columns.json'
+    return path + '.csv'
+
+
+
+"""Loads a table of the collection, from its columnar binary format (see build_wikIR.save_columnar) if it was saved, 
+    from its csv file otherwise.
+    
+    Args:
+        (str) path: path of the table without extension
+        (str) index_col: name of the column used as index (if None: the first column of the csv file)
+        
+    Returns:
+        (pandas.DataFrame) frame: the table
+
+"""
+def load_table(path,index_col=None):
+    if table_file(path).endswith('.json'):
+        return columnar.load_frame(path + '.columns',index_col)
+    return pd.read_csv(path + '.csv',index_col=index_col if index_col else 0)
+
+
+
 """Loads the train validation and tests sets of the collection into matchzoo DataPacks.
+    The documents are parsed once and the same table is used by the three DataPacks.
     
     Args:
         (str) collection_path: path of the collection directory
+        (bool) restrict_documents: indicates whether or not to keep in each DataPack only the documents its relation references
         
     Returns:
         (matchzoo.data_pack.data_pack.DataPack) train_raw: train set 
@@ -21,70 +72,337 @@ import matchzoo as mz
 
 """
 
-def load_wikIR(collection_path):
-    
-    left = pd.read_csv(collection_path + '/training/queries.csv',index_col='id_left')
-    right = pd.read_csv(collection_path + '/documents.csv',index_col='id_right')
-    relation = pd.read_csv(collection_path + '/training/BM25.qrels.csv',index_col=0)
-    train_raw = mz.DataPack(left=left,right=right,relation=relation)
+def load_wikIR(collection_path,restrict_documents=False):
     
-    left = pd.read_csv(collection_path + '/validation/queries.csv',index_col='id_left')
-    right = pd.read_csv(collection_path + '/documents.csv',index_col='id_right')
-    relation = pd.read_csv(collection_path + '/validation/BM25.qrels.csv',index_col=0)
-    validation_raw = mz.DataPack(left=left,right=right,relation=relation)
+    documents = load_table(collection_path + '/documents','id_right')
     
-    left = pd.read_csv(collection_path + '/test/queries.csv',index_col='id_left')
-    right = pd.read_csv(collection_path + '/documents.csv',index_col='id_right')
-    relation = pd.read_csv(collection_path + '/test/BM25.qrels.csv',index_col=0)
-    test_raw = mz.DataPack(left=left,right=right,relation=relation)
+    data_packs = []
+    for name in ['training','validation','test']:
+        left = load_table(collection_path + '/' + name + '/queries','id_left')
+        relation = load_table(collection_path + '/' + name + '/BM25.qrels')
+        right = documents
+        if restrict_documents:
+            right = documents[documents.index.isin(relation['id_right'])]
+        data_packs.append(mz.DataPack(left=left,right=right,relation=relation))
     
+    train_raw,validation_raw,test_raw = data_packs
     return train_raw,validation_raw,test_raw
 
 
+
+"""Preprocesses several DataPacks with a single transform: queries and documents referenced by several DataPacks 
+    are processed once and the processed DataPacks share them.
+    
+    Args:
+        (matchzoo.preprocessors) preprocessor: fitted preprocessor
+        (list) data_packs: DataPacks to preprocess (e.g. output of load_wikIR with restrict_documents=True)
+        
+    Returns:
+        (list) processed: preprocessed DataPacks, in the same order
+
+"""
+def transform_wikIR(preprocessor,data_packs):
+    left = pd.concat([data_pack.left for data_pack in data_packs])
+    right = pd.concat([data_pack.right for data_pack in data_packs])
+    all_data = mz.DataPack(left=left[~left.index.duplicated()],
+                           right=right[~right.index.duplicated()],
+                           relation=pd.concat([data_pack.relation for data_pack in data_packs],ignore_index=True))
+    all_processed = preprocessor.transform(all_data, verbose=0)
+    
+    processed = []
+    for data_pack in data_packs:
+        relation = data_pack.relation
+        relation = relation[relation['id_left'].isin(all_processed.left.index) & relation['id_right'].isin(all_processed.right.index)]
+        processed.append(mz.DataPack(left=all_processed.left[all_processed.left.index.isin(relation['id_left'])],
+                                     right=all_processed.right[all_processed.right.index.isin(relation['id_right'])],
+                                     relation=relation.reset_index(drop=True)))
+    return processed
+
+
+"""Computes the key of the collection used by the cached preprocessing artifacts: it changes when one of the
+    tables loaded by load_wikIR is saved again.
+
+    Args:
+        (str) collection_path: path of the collection directory
+        
+    Returns:
+        (str) key: output of checkpoints.stage_key
+
+"""
+def collection_key(collection_path):
+    paths = [collection_path + '/documents']
+    for name in ['training','validation','test']:
+        paths += [collection_path + '/' + name + '/queries',collection_path + '/' + name + '/BM25.qrels']
+    return checkpoints.stage_key('collection',[checkpoints.file_fingerprint(table_file(path)) for path in paths])
+
+
+
+"""Loads the embeddings given in the config file (GloVe 300d embeddings if the config file has no embeddings_path).
+    The text file of embeddings_path is converted once to a binary table that is memory-mapped (see embeddings.load_embeddings).
+    
+    Args:
+        (dict) config: experiment configuration
+        
+    Returns:
+        (matchzoo.embedding.Embedding) embedding: word embeddings (embeddings.Embedding for embeddings_path)
+
+"""
+def load_embedding(config):
+    if "embeddings_path" in config:
+        return embeddings.load_embeddings(config["embeddings_path"])
+    return mz.datasets.embeddings.load_glove_embedding(dimension=300)
+
+
+
+"""Returns the vectors of the terms of a vocabulary found in the embeddings.
+
+    Args:
+        (matchzoo.embedding.Embedding) embedding: word embeddings (or embeddings.Embedding)
+        (dict) term_index: keys are terms and values are their index in the matrix
+
+    Returns:
+        (numpy.ndarray) vectors: vectors[i] is the vector of the term of index i (zeros if it is not in the embeddings)
+        (numpy.ndarray) found: found[i] indicates whether or not the term of index i is in the embeddings
+
+"""
+def embedding_vectors(embedding,term_index):
+    if isinstance(embedding,embeddings.Embedding):
+        vectors = np.zeros((len(term_index),embedding.output_dim))
+        found = np.zeros(len(term_index),dtype=bool)
+        indexes,rows = embedding.lookup(term_index)
+        if indexes:
+            vectors[indexes] = embedding.vectors[np.array(rows)]
+            found[indexes] = True
+        return vectors,found
+    vectors = embedding.build_matrix(term_index,initializer=lambda: np.nan)
+    found = ~np.isnan(vectors).any(axis=1)
+    vectors[~found] = 0
+    return vectors,found
+
+
+
+"""Embedding built from cached vectors (output of embedding_vectors). The rows of the terms that are not in the embeddings
+    are drawn again each time a matrix is built, with the same draws as matchzoo.embedding.Embedding.build_matrix,
+    so that models and runs sharing the cache do not share their random rows.
+
+    Args:
+        (numpy.ndarray) vectors: output of embedding_vectors
+        (numpy.ndarray) found: output of embedding_vectors
+
+"""
+class CachedEmbedding:
+
+    def __init__(self,vectors,found):
+        self.vectors = vectors
+        self.found = found
+
+
+
+    @property
+    def output_dim(self):
+        return self.vectors.shape[1]
+
+
+
+    def build_matrix(self,term_index,*args,**kwargs):
+        matrix = np.random.uniform(-0.2,0.2,size=self.vectors.shape)
+        matrix[self.found] = self.vectors[self.found]
+        return matrix
+
+
+
+"""Prepares a model like mz.auto.prepare and the preprocessed train, validation and test sets. 
+    The fitted preprocessor, the vectors of its vocabulary and the preprocessed sets are cached in cache_dir,
+    keyed by the collection, the preprocessor and its parameters (and the embeddings for the vectors), 
+    so that models sharing the same preprocessor and later runs skip fitting, embedding loading and preprocessing.
+    The model and its data generator builder are built from the fitted preprocessor with mz.auto.Preparer, 
+    the random rows of the embedding matrix are drawn for each model (see CachedEmbedding).
+    
+    Args:
+        (matchzoo.engine.base_task) task: ranking task
+        (class) model_class: matchzoo model class
+        (list) data_packs: output of load_wikIR
+        (dict) config: experiment configuration
+        (function) get_embedding: returns the embeddings (called only if the vectors are not cached)
+        (str) cache_dir: directory of the cache (if None: nothing is cached)
+        (str) key: key of the collection, output of collection_key
+        (int) cache_size: maximum size of the cache in bytes (if None: no limit)
+        
+    Returns:
+        (matchzoo.models) model: matchzoo model
+        (matchzoo.data_generator.data_generator_builder.DataGeneratorBuilder) data_generator_builder: generator builder of the model
+        (list) processed: preprocessed train, validation and test sets
+
+"""
+def prepare_model(task,model_class,data_packs,config,get_embedding,cache_dir=None,key=None,cache_size=None):
+    preprocessor = model_class.get_default_preprocessor(**PREPROCESSING_PARAMS)
+    preprocessor_key = checkpoints.stage_key(key,type(preprocessor).__name__,PREPROCESSING_PARAMS)
+    embedding_key = checkpoints.stage_key(preprocessor_key,
+                                          checkpoints.file_fingerprint(config["embeddings_path"]) if "embeddings_path" in config else 'glove.300d')
+    with_embedding = 'with_embedding' in model_class.get_default_params()
+    
+    fitted,vectors,processed = None,None,None
+    if cache_dir is not None:
+        fitted = checkpoints.load_stage(cache_dir,'preprocessor',preprocessor_key)
+        processed = checkpoints.load_stage(cache_dir,'processed',preprocessor_key)
+        if with_embedding:
+            vectors = checkpoints.load_stage(cache_dir,'embedding_vectors',embedding_key)
+    
+    if fitted is not None:
+        preprocessor = fitted
+    else:
+        if issubclass(model_class,(mz.models.DSSM,mz.models.CDSSM)):
+            preprocessor.with_word_hashing = False
+        preprocessor.fit(data_packs[0],verbose=0)
+        processed = None
+        vectors = None
+        if cache_dir is not None:
+            checkpoints.save_stage(cache_dir,'preprocessor',preprocessor_key,preprocessor,cache_size)
+    
+    embedding = None
+    if with_embedding:
+        if vectors is None:
+            vectors = embedding_vectors(get_embedding(),preprocessor.context['vocab_unit'].state['term_index'])
+            if cache_dir is not None:
+                checkpoints.save_stage(cache_dir,'embedding_vectors',embedding_key,vectors,cache_size)
+        embedding = CachedEmbedding(*vectors)
+    
+    preparer = mz.auto.Preparer(task=task)
+    model,embedding_matrix = preparer._build_model(model_class,preprocessor,embedding)
+    data_generator_builder = preparer._build_data_gen_builder(model,embedding_matrix,preprocessor)
+    
+    if processed is None:
+        processed = transform_wikIR(preprocessor,data_packs)
+        if cache_dir is not None:
+            checkpoints.save_stage(cache_dir,'processed',preprocessor_key,processed,cache_size)
+    
+    return model,data_generator_builder,processed
+
+
+
+"""Groups consecutive batches of a generator so that the model is called once for many pairs instead of once per batch
+    (batches whose inputs do not have the same shapes are not grouped).
+    
+    Args:
+        (matchzoo.data_generator.data_generator.DataGenerator) set_gen: set on which the model will be evaluated
+        (int) group_size: number of pairs above which a group is complete
+        
+    Returns:
+        (generator) groups: tuples (inputs,nb_batches) where inputs is a dictionary of the concatenated inputs of nb_batches batches
+        
+"""
+def group_batches(set_gen,group_size):
+    group = []
+    nb_elems = 0
+    for i in range(len(set_gen)):
+        batch_x, _ = set_gen[i]
+        if group and any(batch_x[key].shape[1:] != group[0][key].shape[1:] for key in batch_x):
+            yield concatenate_batches(group),len(group)
+            group = []
+            nb_elems = 0
+        group.append(batch_x)
+        nb_elems += len(batch_x['id_left'])
+        if nb_elems >= group_size:
+            yield concatenate_batches(group),len(group)
+            group = []
+            nb_elems = 0
+    if group:
+        yield concatenate_batches(group),len(group)
+
+
+
+"""Concatenates the inputs of batches.
+    
+    Args:
+        (list) group: inputs of the batches (dictionaries of numpy arrays with the same keys)
+        
+    Returns:
+        (dict) inputs: keys are the keys of the batches and values are their concatenated inputs
+        
+"""
+def concatenate_batches(group):
+    if len(group) == 1:
+        return group[0]
+    return {key:np.concatenate([batch_x[key] for batch_x in group]) for key in group[0]}
+
+
+
 """Returns the scores givne by a model on the validation or test datapacks.
+    The batches of the generator are grouped (see group_batches), each group is predicted with one call to the model
+    and the scores are written into preallocated arrays, then the pairs are sorted by query id and by decreasing score
+    with a single np.lexsort.
     
     Args:
         (matchzoo.models) model: matchzoo model
         (matchzoo.data_generator.data_generator.DataGenerator) set_gen: set on which the model will be evaluated
+        (int) group_size: number of pairs above which a group of batches is predicted
+        (int) batch_size: number of pairs per batch of the model
         
     Returns:
-        (list) results: a sorted list of tuples (query_id,document_ids,scores) 
+        (tuple) results: numpy arrays (query_ids,document_ids,scores) sorted by query id and by decreasing score
         
 """
 
-def predict(model,set_gen):
-    set_x, _ = set_gen[:]
-    nb_elems = len(set_x['id_left'])
-    scores = model.predict(set_x).reshape(nb_elems).tolist()
-    q_ids = set_x['id_left'].reshape(nb_elems).tolist()
-    d_ids = set_x['id_right'].reshape(nb_elems).tolist()
-    results = [[q,d,s] for (q,d,s) in zip(q_ids,d_ids,scores)]
-    results.sort(key=lambda tup: -tup[2])
-    results.sort(key=lambda tup: tup[0])
-    return results
+def predict(model,set_gen,group_size=4096,batch_size=128):
+    q_ids = d_ids = scores = None
+    nb_elems = 0
+    for batch_x,nb_batches in group_batches(set_gen,group_size):
+        batch_size_x = len(batch_x['id_left'])
+        if q_ids is None:
+            capacity = -(-batch_size_x // nb_batches) * len(set_gen)
+            q_ids = np.empty(capacity,dtype=np.int64)
+            d_ids = np.empty(capacity,dtype=np.int64)
+            scores = np.empty(capacity,dtype=np.float32)
+        elif nb_elems + batch_size_x > len(q_ids):
+            capacity = 2 * (nb_elems + batch_size_x)
+            q_ids,d_ids,scores = [np.resize(array,capacity) for array in (q_ids,d_ids,scores)]
+        q_ids[nb_elems:nb_elems+batch_size_x] = batch_x['id_left'].reshape(batch_size_x)
+        d_ids[nb_elems:nb_elems+batch_size_x] = batch_x['id_right'].reshape(batch_size_x)
+        scores[nb_elems:nb_elems+batch_size_x] = model.predict(batch_x,batch_size=batch_size).reshape(batch_size_x)
+        nb_elems += batch_size_x
+    
+    if q_ids is None:
+        return np.empty(0,dtype=np.int64),np.empty(0,dtype=np.int64),np.empty(0,dtype=np.float32)
+    q_ids,d_ids,scores = q_ids[:nb_elems],d_ids[:nb_elems],scores[:nb_elems]
+    order = np.lexsort((-scores,q_ids))
+    return q_ids[order],d_ids[order],scores[order]
     
     
 """Saves results in a format compatible with trec_eval:
     
     Args:
         (str) file: path of the file where the results will be saved
-        (dict) results: output of predict
+        (tuple) results: output of predict
         (str) name: name of the model
                 
 """  
 def save_results(file,results,name):
-    with open(file,'w') as f:
-        counter = -1
-        q_id = results[0][0]
-        for elem in results:
-            if elem[0]==q_id: 
-                counter+=1
-            else:
-                counter = 0
-                q_id = elem[0]
-            f.write(str(q_id) + ' Q0 ' + str(elem[1]) + ' ' + str(counter) + ' ' + str(elem[2]) + ' ' + name + '\n')
+    trec.write_run(file,*results,name)
             
 
+"""Evaluates the results of a matchzoo model in memory and saves their metrics, the metrics of each query (and the results):
+    
+    Args:
+        (tuple) results: output of predict
+        (str) model_path: path of the directory where the results will be saved
+        (int) run: indicates the current run
+        (int) epoch: indicates the current epoch
+        (evaluation.Evaluator) evaluator: evaluator of the qrels of the set
+        (bool) save_run: indicates whether or not to save the results in a format compatible with trec_eval
+""" 
+def save_and_evaluate(results,model_path,run,epoch,evaluator,save_run=True):
+    
+    if save_run:
+        save_results(model_path + '/run.' + str(run) + '.epoch.' + str(epoch) + '.res',
+                                         results,
+                                         'run.' + str(run)+ '.epoch.' + str(epoch) )
+    
+    evaluator.evaluate(evaluation.run_from_arrays(*results),
+                       model_path + '/run.' + str(run) + '.epoch.' + str(epoch) + '.metrics.json',
+                       model_path + '/run.' + str(run) + '.epoch.' + str(epoch) + '.metrics.npz')
+
+
+
 """Compute the scores and save the results and the metrics of a matchzoo model:
     
     Args:
@@ -97,18 +415,75 @@ def save_results(file,results,name):
         (str) qrels_path: path of the qrels
 """ 
 def evaluate_and_save_results(model,set_gen,model_path,run,epoch,collection_path,qrels_path):
+    save_and_evaluate(predict(model,set_gen),model_path,run,epoch,evaluation.Evaluator.from_file(qrels_path))
+
+
+
+"""Evaluates a model during training: the scores of the model are computed in the training loop when an evaluation is submitted
+    (a snapshot of the model at the current epoch), then the results are saved and evaluated by a background thread
+    while the next epoch trains.
     
-    set_results = predict(model,set_gen)
-    
-    save_results(model_path + '/run.' + str(run) + '.epoch.' + str(epoch) + '.res',
-                                     set_results,
-                                     'run.' + str(run)+ '.epoch.' + str(epoch) )
-    
-    build_wikIR.evaluate(model_path + '/run.' + str(run) + '.epoch.' + str(epoch) + '.metrics.json',
-                         qrels_path,
-                         model_path + '/run.' + str(run) + '.epoch.' + str(epoch) + '.res')
+"""
+class EvaluationScheduler:
+
+    def __init__(self,save_runs=True):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.futures = []
+        self.save_runs = save_runs
+
+
 
+    """Computes the scores of the model and schedules save_and_evaluate.
+        
+        Args:
+            (matchzoo.models) model: matchzoo model
+            (matchzoo.data_generator.data_generator.DataGenerator) set_gen: set on which the model will be evaluated
+            (str) model_path: path of the directory where the results will be saved
+            (int) run: indicates the current run
+            (int) epoch: indicates the current epoch
+            (evaluation.Evaluator) evaluator: evaluator of the qrels of the set
     
+    """
+    def submit(self,model,set_gen,model_path,run,epoch,evaluator):
+        results = predict(model,set_gen)
+        self.futures.append(self.executor.submit(save_and_evaluate,results,model_path,run,epoch,evaluator,self.save_runs))
+        for future in [future for future in self.futures if future.done()]:
+            self.futures.remove(future)
+            future.result()
+
+
+
+    """Waits for the scheduled evaluations."""
+    def close(self):
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            self.futures = []
+            self.executor.shutdown()
+
+
+
+"""Parses a strictly positive integer argument.
+
+    Args:
+        (str) value: value given on the command line
+
+    Returns:
+        (int) value: the integer
+
+"""
+def positive_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(value + ' is not an integer')
+    if number < 1:
+        raise argparse.ArgumentTypeError(value + ' must be at least 1')
+    return number
+
+
+
 def main():
     
     parser = argparse.ArgumentParser()
@@ -116,6 +491,10 @@ def main():
     parser.add_argument('-g','--gpu', nargs="?", type=str, default = None)
     parser.add_argument('-e','--epoch', nargs="?", type=int, default = 50)
     parser.add_argument('-r','--run_id', nargs="?", type=int, default = 0)
+    parser.add_argument('--cache_dir', nargs="?", type=str, default = None)
+    parser.add_argument('--cache_size', nargs="?", type=int, default = None)
+    parser.add_argument('--eval_every', nargs="?", type=positive_int, default = 1)
+    parser.add_argument('--no_run_files', action="store_true")
     
     args = parser.parse_args()
     
@@ -127,22 +506,14 @@ def main():
     if args.gpu:
         os.environ["CUDA_VISIBLE_DEVICES"]=args.gpu
     
-    train_raw,validation_raw,test_raw = load_wikIR(config["collection_path"])
-    
-    
-    if "embeddings_path" in config:
-        csv.field_size_limit(sys.maxsize)
-        data = pd.read_csv(config["embeddings_path"],
-                    sep=" ",
-                    index_col=0,
-                    header=None,
-                    skiprows=1,
-                    quoting=csv.QUOTE_NONE)
-        embedding = mz.embedding.Embedding(data)
+    data_packs = load_wikIR(config["collection_path"],restrict_documents=True)
+    key = collection_key(config["collection_path"]) if args.cache_dir else None
+    cache_size = args.cache_size * 2**20 if args.cache_size else None
     
-    
-    else: 
-        embedding = mz.datasets.embeddings.load_glove_embedding(dimension=300)
+    measures = evaluation.MEASURES | set(config["measures"])
+    validation_evaluator = evaluation.Evaluator.from_file(config["collection_path"] + '/validation/qrels',measures)
+    test_evaluator = evaluation.Evaluator.from_file(config["collection_path"] + '/test/qrels',measures)
+    get_embedding = functools.lru_cache(maxsize=None)(functools.partial(load_embedding,config))
     
     task = mz.tasks.Ranking(loss=mz.losses.RankCrossEntropyLoss(num_neg=5))
     IR_models = [mz.models.list_available()[i] for i in config["index_mz_models"]]
@@ -163,63 +534,36 @@ def main():
             os.mkdir(test_path)
 
 
-        preprocessor = model_class.get_default_preprocessor(
-                             fixed_length_left= 10,
-                             fixed_length_right = 200,
-                             filter_mode = 'tf',
-                             filter_low_freq = 5,
-                             filter_high_freq = float('inf'),
-                             remove_stop_words = True)
-
-        model, preprocessor, data_generator_builder, embedding_matrix = mz.auto.prepare(
-            task=task,
-            model_class=model_class,
-            data_pack=train_raw,
-            preprocessor=preprocessor,
-            embedding = embedding)
-
-        train_processed = preprocessor.transform(train_raw, verbose=0)
-        validation_processed = preprocessor.transform(validation_raw, verbose=0)
-        test_processed = preprocessor.transform(test_raw, verbose=0)
+        model,data_generator_builder,processed = prepare_model(task,model_class,data_packs,config,get_embedding,
+                                                               args.cache_dir,key,cache_size)
+        train_processed,validation_processed,test_processed = processed
 
         train_gen = data_generator_builder.build(train_processed,batch_size=64,mode='pair')
         validation_gen = data_generator_builder.build(validation_processed,mode='pair',num_neg=0,num_dup=1)
         test_gen = data_generator_builder.build(test_processed,mode='pair',num_neg=0,num_dup=1)
 
-        evaluate_and_save_results(model,
-                                  validation_gen,
-                                  validation_path,
-                                  args.run_id,
-                                  0,
-                                  config["collection_path"],
-                                  config["collection_path"] + '/validation/qrels')
-
-        evaluate_and_save_results(model,
-                                  test_gen,
-                                  test_path,
-                                  args.run_id,
-                                  0,
-                                  config["collection_path"],
-                                  config["collection_path"] + '/test/qrels')
-
-        for _ in range(args.epoch):
-            model.fit_generator(train_gen, epochs=1,verbose=0)
-
-            evaluate_and_save_results(model,
-                                      validation_gen,
-                                      validation_path,
-                                      args.run_id,
-                                      (1+_),
-                                      config["collection_path"],
-                                      config["collection_path"] + '/validation/qrels')
-
-            evaluate_and_save_results(model,
-                                      test_gen,
-                                      test_path,
-                                      args.run_id,
-                                      (1+_),
-                                      config["collection_path"],
-                                      config["collection_path"] + '/test/qrels')
+        scheduler = EvaluationScheduler(not args.no_run_files)
+        try:
+            for epoch in range(args.epoch + 1):
+                if epoch > 0:
+                    model.fit_generator(train_gen, epochs=1,verbose=0)
+                
+                if epoch % args.eval_every == 0 or epoch == args.epoch:
+                    scheduler.submit(model,
+                                     validation_gen,
+                                     validation_path,
+                                     args.run_id,
+                                     epoch,
+                                     validation_evaluator)
+                    
+                    scheduler.submit(model,
+                                     test_gen,
+                                     test_path,
+                                     args.run_id,
+                                     epoch,
+                                     test_evaluator)
+        finally:
+            scheduler.close()
     
 if __name__ == "__main__":
     main()
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import cProfile
+import resource
+import threading
+import tracemalloc
+import contextlib
+
+
+
+"""Stages running in each thread, the innermost stage is the last one"""
+_active_stages = threading.local()
+
+
+
+"""Resets the peak resident set size of the process (only supported by Linux).
+
+    Returns:
+        (bool) reset: indicates whether or not the peak has been reset
+
+"""
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs','w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+
+"""Returns the peak resident set size of the process since it started or since the last call to reset_peak_rss.
+
+    Returns:
+        (float) peak: peak resident set size in MB
+
+"""
+def peak_rss():
+    try:
+        with open('/proc/self/status','r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if os.uname().sysname == 'Darwin' else peak / 1024
+
+
+
+"""Returns the CPU time used by the process and by its terminated child processes.
+
+    Returns:
+        (float) cpu_time: CPU time in seconds (user + system)
+
+"""
+def cpu_time():
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return self_usage.ru_utime + self_usage.ru_stime + children_usage.ru_utime + children_usage.ru_stime
+
+
+
+"""Adds processed items to the innermost stage running in this thread (does nothing when no stage is profiled),
+    e.g. add_items(links=nb_links) inside build_qrels. Throughputs are computed from the items of each stage.
+
+    Args:
+        (dict) items: keys are names of items and values are numbers of items
+
+"""
+def add_items(**items):
+    stages = getattr(_active_stages,'stack',None)
+    if not stages:
+        return
+    counts = stages[-1]['items']
+    for name,value in items.items():
+        counts[name] = counts.get(name,0) + value
+
+
+
+"""Records wall time, CPU time, peak memory and throughput of the stages of a pipeline.
+
+    Stages should not run concurrently: CPU time and peak memory are measured for the whole process.
+    CPU time of worker processes is counted when they terminate.
+
+    Args:
+        (bool) enabled: indicates whether or not to profile the stages (if False: stage does nothing)
+        (str) dump_dir: directory where a cProfile dump (name.prof) of each stage is saved (if None: no dumps)
+        (bool) trace_memory: indicates whether or not to trace python allocations with tracemalloc, the traced peak is
+                             added to the report and the top allocations of each stage are saved in dump_dir (name.tracemalloc.txt)
+
+"""
+class Profiler:
+
+    def __init__(self,enabled=False,dump_dir=None,trace_memory=False):
+        self.enabled = enabled
+        self.dump_dir = dump_dir
+        self.trace_memory = enabled and trace_memory
+        self.stages = []
+        self.start_wall = time.perf_counter()
+        self.start_cpu = cpu_time()
+        self._profiling = False
+        if enabled and dump_dir is not None and not os.path.exists(dump_dir):
+            os.makedirs(dump_dir)
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+
+    """Profiles the code run inside a with statement.
+
+        Args:
+            (str) name: name of the stage
+            (dict) items: keys are names of items processed by the stage and values are numbers of items, more items
+                          can be added inside the stage with add_items
+
+        Returns:
+            (dict) record: record of the stage, completed when the stage ends (None if the profiler is disabled)
+
+    """
+    @contextlib.contextmanager
+    def stage(self,name,**items):
+        if not self.enabled:
+            yield None
+            return
+
+        record = {'name':name,'items':dict(items)}
+        stages = getattr(_active_stages,'stack',None)
+        if stages is None:
+            stages = _active_stages.stack = []
+        stages.append(record)
+
+        profile = None
+        if self.dump_dir is not None and not self._profiling:
+            self._profiling = True
+            profile = cProfile.Profile()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        peak_reset = reset_peak_rss()
+        start_cpu = cpu_time()
+        start_wall = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+            wall_time = time.perf_counter() - start_wall
+            record['wall_time'] = wall_time
+            record['cpu_time'] = cpu_time() - start_cpu
+            record['peak_rss_mb'] = peak_rss()
+            record['peak_rss_since_start'] = not peak_reset
+            record['throughput'] = {item + '/s':(value / wall_time if wall_time > 0 else None)
+                                    for item,value in record['items'].items()}
+            if self.trace_memory:
+                record['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+                if self.dump_dir is not None:
+                    self._dump_allocations(name)
+            if profile is not None:
+                profile.dump_stats(os.path.join(self.dump_dir,name + '.prof'))
+                self._profiling = False
+            stages.pop()
+            self.stages.append(record)
+            print('Stage',name,'took','%.2f' % wall_time,'s',flush=True)
+
+
+
+    """Saves the top allocations of the traced memory in dump_dir/name.tracemalloc.txt.
+
+        Args:
+            (str) name: name of the stage
+            (int) limit: number of allocation sites saved
+
+    """
+    def _dump_allocations(self,name,limit=50):
+        statistics = tracemalloc.take_snapshot().statistics('lineno')
+        with open(os.path.join(self.dump_dir,name + '.tracemalloc.txt'),'w') as f:
+            for statistic in statistics[:limit]:
+                f.write(str(statistic) + '\n')
+
+
+
+    """Returns the report of the profiled stages.
+
+        Args:
+            (dict) metadata: json serializable values added to the report (e.g. the arguments of the pipeline)
+
+        Returns:
+            (dict) report: stages in the order they ended and totals of the whole run
+
+    """
+    def report(self,metadata=None):
+        return {'metadata':metadata or dict(),
+                'stages':self.stages,
+                'total':{'wall_time':time.perf_counter() - self.start_wall,
+                         'cpu_time':cpu_time() - self.start_cpu,
+                         'peak_rss_mb':max([stage['peak_rss_mb'] for stage in self.stages],default=peak_rss())}}
+
+
+
+    """Saves the report of the profiled stages in a json file.
+
+        Args:
+            (str) path: path of the json file
+            (dict) metadata: json serializable values added to the report (e.g. the arguments of the pipeline)
+
+    """
+    def save(self,path,metadata=None):
+        with open(path,'w') as f:
+            json.dump(self.report(metadata),f,indent=2)
@@ -0,0 +1,179 @@
+import numpy as np
+
+
+
+"""Relevance judgments stored as flat numpy arrays grouped by query (CSR-style).
+
+    The judgments of the query query_ids[i] are the documents doc_ids[indptr[i]:indptr[i+1]]
+    with relevance levels rels[indptr[i]:indptr[i+1]]. Queries keep the order in which they were built.
+
+    Args:
+        (numpy.ndarray) query_ids: ids of the queries
+        (numpy.ndarray) indptr: boundaries of the judgments of each query
+        (numpy.ndarray) doc_ids: ids of the judged documents
+        (numpy.ndarray) rels: relevance levels
+
+"""
+class Qrels:
+
+    def __init__(self,query_ids,indptr,doc_ids,rels):
+        self.query_ids = np.asarray(query_ids,dtype=np.int64)
+        self.indptr = np.asarray(indptr,dtype=np.int64)
+        self.doc_ids = np.asarray(doc_ids,dtype=np.int64)
+        self.rels = np.asarray(rels,dtype=np.int8)
+        size = int(self.query_ids.max()) + 1 if len(self.query_ids) else 0
+        self.rows = np.full(size,-1,dtype=np.int64)
+        self.rows[self.query_ids] = np.arange(len(self.query_ids))
+
+
+
+    """Builds the qrels from (query,document) pairs labelled with a relevance level of 1.
+
+        Queries with less than min_rel relevant documents are removed, and each query is
+        judged relevant with a level of 2 to the document built from the same article.
+
+        Args:
+            (iterable) keys: ids of the candidate queries, in order
+            (numpy.ndarray) query_ids: query of each pair
+            (numpy.ndarray) doc_ids: document of each pair, pairs of a query are kept in this order
+            (int) min_rel: minimum number of relevant documents required to keep a query
+
+        Returns:
+            (Qrels) qrels: relevance judgments
+
+    """
+    @classmethod
+    def from_pairs(cls,keys,query_ids,doc_ids,min_rel):
+        keys = np.fromiter(keys,dtype=np.int64)
+        query_ids = np.asarray(query_ids,dtype=np.int64)
+        doc_ids = np.asarray(doc_ids,dtype=np.int64)
+
+        ranks = np.full(int(keys.max()) + 1 if len(keys) else 0,-1,dtype=np.int64)
+        ranks[keys] = np.arange(len(keys))
+        query_ranks = ranks[query_ids]
+        order = np.argsort(query_ranks,kind='stable')
+        query_ranks = query_ranks[order]
+        doc_ids = doc_ids[order]
+        counts = np.bincount(query_ranks,minlength=len(keys))
+        keep = counts >= min_rel
+
+        doc_ids = doc_ids[keep[query_ranks]]
+        query_ids = keys[keep]
+        indptr = np.zeros(len(query_ids) + 1,dtype=np.int64)
+        np.cumsum(counts[keep] + 1,out=indptr[1:])
+
+        first = np.zeros(indptr[-1],dtype=bool)
+        first[indptr[:-1]] = True
+        all_doc_ids = np.empty(indptr[-1],dtype=np.int64)
+        all_doc_ids[first] = query_ids
+        all_doc_ids[~first] = doc_ids
+        rels = np.where(first,2,1)
+        return cls(query_ids,indptr,all_doc_ids,rels)
+
+
+
+    def __len__(self):
+        return len(self.query_ids)
+
+
+
+    def __contains__(self,query_id):
+        return 0 <= query_id < len(self.rows) and self.rows[query_id] >= 0
+
+
+
+    def __iter__(self):
+        return iter(self.query_ids.tolist())
+
+
+
+    """Returns the judgments of a query.
+
+        Args:
+            (int) query_id: id of the query
+
+        Returns:
+            (numpy.ndarray) doc_ids: ids of the judged documents
+            (numpy.ndarray) rels: relevance levels
+
+    """
+    def get(self,query_id):
+        row = self.rows[query_id]
+        return self.doc_ids[self.indptr[row]:self.indptr[row+1]],self.rels[self.indptr[row]:self.indptr[row+1]]
+
+
+
+    """Returns the total number of (query,document) pairs."""
+    def nb_pairs(self):
+        return len(self.doc_ids)
+
+
+
+    """Returns the judgments of a subset of queries as flat arrays.
+
+        Args:
+            (list) subset: ids of the queries, in the order of the output
+
+        Returns:
+            (numpy.ndarray) query_ids: query of each pair
+            (numpy.ndarray) doc_ids: document of each pair
+            (numpy.ndarray) rels: relevance level of each pair
+
+    """
+    def select(self,subset):
+        rows = self.rows[np.asarray(subset,dtype=np.int64)]
+        starts = self.indptr[rows]
+        sizes = self.indptr[rows + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(sizes) + sizes,sizes) + np.arange(sizes.sum())
+        return np.repeat(self.query_ids[rows],sizes),self.doc_ids[offsets],self.rels[offsets]
+
+
+
+    """Keeps the pairs of the selected queries and documents, queries left without judgments are removed.
+
+        Args:
+            (numpy.ndarray) query_mask: boolean mask of the queries to keep
+            (numpy.ndarray) pair_mask: boolean mask of the pairs to keep
+
+        Returns:
+            (Qrels) qrels: filtered relevance judgments
+
+    """
+    def _filter(self,query_mask,pair_mask):
+        pair_rows = np.repeat(np.arange(len(self.query_ids)),np.diff(self.indptr))
+        pair_mask = pair_mask & query_mask[pair_rows]
+        sizes = np.bincount(pair_rows[pair_mask],minlength=len(self.query_ids))
+        keep = sizes > 0
+        indptr = np.zeros(np.count_nonzero(keep) + 1,dtype=np.int64)
+        np.cumsum(sizes[keep],out=indptr[1:])
+        return Qrels(self.query_ids[keep],indptr,self.doc_ids[pair_mask],self.rels[pair_mask])
+
+
+
+    """Removes queries.
+
+        Args:
+            (iterable) query_ids: ids of the queries to remove
+
+        Returns:
+            (Qrels) qrels: relevance judgments without these queries
+
+    """
+    def remove_queries(self,query_ids):
+        query_ids = np.fromiter(query_ids,dtype=np.int64)
+        return self._filter(~np.isin(self.query_ids,query_ids),np.ones(len(self.doc_ids),dtype=bool))
+
+
+
+    """Removes documents from the judgments, queries left without relevant documents are removed.
+
+        Args:
+            (iterable) doc_ids: ids of the documents to remove
+
+        Returns:
+            (Qrels) qrels: relevance judgments without these documents
+
+    """
+    def remove_documents(self,doc_ids):
+        doc_ids = np.fromiter(doc_ids,dtype=np.int64)
+        return self._filter(np.ones(len(self.query_ids),dtype=bool),~np.isin(self.doc_ids,doc_ids))
@@ -6,8 +6,6 @@ python wikiextractor/WikiExtractor.py enwiki-20191101-pages-articles-multistream
 
 rm enwiki-20191101-pages-articles-multistream.xml
 
-python build_wikIR.py --input enwiki.json --output_dir $1/wikIR1k --max_docs 370000 --validation_part 100 --test_part 100 -tfscb
-
-python build_wikIR.py --input enwiki.json --output_dir $1/wikIR59k --validation_part 1000 --test_part 1000 -tfscb
+python build_variants.py --input enwiki.json --variants wikIR_variants.json --output_root $1
 
 rm enwiki.json
@@ -0,0 +1,95 @@
+import functools
+from urllib.parse import unquote
+
+
+
+"""Normalizes a wikipedia title or the target of a link so that both can be compared.
+
+    Percent-escapes are decoded before the section anchor is removed (wikiextractor quotes the whole href,
+    so the anchor arrives as %23), underscores are equivalent to spaces and the first letter is upper cased
+    (as wikipedia does for article titles), e.g. 'foo_bar%23History' and 'Foo bar#History' both give 'Foo bar'.
+
+    Args:
+        (str) title: title of an article or href attribute of a link
+
+    Returns:
+        (str) key: normalized title
+
+"""
+def normalize_title(title):
+    title = unquote(title).split('#',1)[0].replace('_',' ')
+    title = ' '.join(title.split())
+    return title[:1].upper() + title[1:]
+
+
+
+"""Reads a redirects file: one redirect per line, the title of the redirect page and the title of the target
+    article separated by a tabulation.
+
+    Args:
+        (str) file: path of the redirects file
+
+    Returns:
+        (dict) redirects: keys are titles of redirect pages and values are titles of target articles
+
+"""
+def read_redirects(file):
+    redirects = dict()
+    with open(file,'r',encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) == 2:
+                redirects[fields[0]] = fields[1]
+    return redirects
+
+
+
+"""Maps the targets of links to doc ids, built once from the titles of the collection.
+
+    Lookups of the same href are cached, since the same articles are linked from many documents.
+
+    Args:
+        (dict) documents_ids: keys are articles titles and values are the associated doc_ids
+        (dict) redirects: output of read_redirects (if None: links to redirect pages are not resolved)
+        (int) cache_size: maximum number of hrefs kept in the cache of resolved links
+        (int) max_hops: maximum number of redirects followed from a redirect page (double redirects)
+
+"""
+class TitleIndex:
+
+    def __init__(self,documents_ids,redirects=None,cache_size=2**20,max_hops=8):
+        self.ids = dict()
+        for title,doc_id in documents_ids.items():
+            self.ids.setdefault(normalize_title(title),doc_id)
+        if redirects:
+            targets = {normalize_title(source):normalize_title(target) for source,target in redirects.items()}
+            for source in targets:
+                key = source
+                for _ in range(max_hops):
+                    if key in self.ids or key not in targets:
+                        break
+                    key = targets[key]
+                if source not in self.ids and key in self.ids:
+                    self.ids[source] = self.ids[key]
+        self.lookup = functools.lru_cache(maxsize=cache_size)(self._lookup)
+
+
+
+    def _lookup(self,href):
+        return self.ids.get(normalize_title(href))
+
+
+
+    """Resolves all the links of a document.
+
+        Args:
+            (list) hrefs: href attributes of the links of the document
+
+        Returns:
+            (set) doc_ids: ids of the documents of the collection targeted by the links
+
+    """
+    def resolve(self,hrefs):
+        doc_ids = set(map(self.lookup,set(hrefs)))
+        doc_ids.discard(None)
+        return doc_ids
@@ -0,0 +1,146 @@
+import gzip
+import numpy as np
+import pandas as pd
+import writers
+
+
+
+"""Number of lines formatted at once by the writers"""
+BLOCK_SIZE = 2**16
+
+
+
+"""Opens a file in text mode, compressed with gzip if its name ends with .gz.
+
+    Args:
+        (str) path: path of the file
+        (str) mode: 'r' or 'w'
+
+    Returns:
+        (file) f: opened file
+
+"""
+def open_text(path,mode='r'):
+    if path.endswith('.gz'):
+        return gzip.open(path,mode + 't',compresslevel=6)
+    if mode == 'w':
+        return writers.open_output(path)
+    return open(path,mode)
+
+
+
+"""Computes the rank of each line of a run: its position among the lines of the same query.
+
+    Args:
+        (numpy.ndarray) query_ids: query of each line, the lines of a query are contiguous
+
+    Returns:
+        (numpy.ndarray) ranks: rank of each line, starting from 0
+
+"""
+def ranks_in_queries(query_ids):
+    if len(query_ids) == 0:
+        return np.empty(0,dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True,query_ids[1:] != query_ids[:-1]])
+    return np.arange(len(query_ids)) - np.repeat(starts,np.diff(np.r_[starts,len(query_ids)]))
+
+
+
+"""Writes columns in a file, formatted BLOCK_SIZE lines at a time.
+
+    Args:
+        (str) path: path of the file (compressed with gzip if it ends with .gz)
+        (str) line_format: %-format of one line
+        (list) columns: numpy arrays of the same length
+
+"""
+def write_columns(path,line_format,columns):
+    nb_lines = len(columns[0]) if columns else 0
+    with open_text(path,'w') as f:
+        for start in range(0,nb_lines,BLOCK_SIZE):
+            block = [column[start:start+BLOCK_SIZE].tolist() for column in columns]
+            f.write(''.join(map(line_format.__mod__,zip(*block))))
+
+
+
+"""Writes a run in the TREC format: query_id Q0 doc_id rank score name
+
+    Args:
+        (str) path: path of the file (compressed with gzip if it ends with .gz)
+        (numpy.ndarray) query_ids: query of each line, the lines of a query are contiguous
+        (numpy.ndarray) doc_ids: document of each line
+        (numpy.ndarray) scores: score of each line
+        (str) name: name of the run
+        (numpy.ndarray) ranks: rank of each line (if None: position of the line among the lines of its query)
+
+"""
+def write_run(path,query_ids,doc_ids,scores,name,ranks=None):
+    if ranks is None:
+        ranks = ranks_in_queries(query_ids)
+    write_columns(path,'%d Q0 %d %d %r ' + name.replace('%','%%') + '\n',[query_ids,doc_ids,ranks,scores])
+
+
+
+"""Writes qrels in the TREC format: query_id 0 doc_id relevance_level (separated by tabulations)
+
+    Args:
+        (str) path: path of the file (compressed with gzip if it ends with .gz)
+        (numpy.ndarray) query_ids: query of each line
+        (numpy.ndarray) doc_ids: document of each line
+        (numpy.ndarray) rels: relevance level of each line
+
+"""
+def write_qrels(path,query_ids,doc_ids,rels):
+    write_columns(path,'%d\t0\t%d\t%d\n',[query_ids,doc_ids,rels])
+
+
+
+"""Reads columns of a whitespace separated file with the C parser of pandas (gzip compressed files are detected from the .gz extension).
+
+    Args:
+        (str) path: path of the file
+        (dict) dtypes: keys are the positions of the columns to read and values are their numpy dtype
+
+    Returns:
+        (list) columns: numpy arrays of the columns, in the order of dtypes
+
+"""
+def read_columns(path,dtypes):
+    try:
+        frame = pd.read_csv(path,sep=r'\s+',header=None,usecols=list(dtypes),dtype=dtypes,
+                            float_precision='round_trip',compression='infer')
+    except pd.errors.EmptyDataError:
+        return [np.empty(0,dtype=dtype) for dtype in dtypes.values()]
+    return [frame[column].to_numpy() for column in dtypes]
+
+
+
+"""Reads a run in the TREC format (query and document ids must be integers).
+
+    Args:
+        (str) path: path of the file (compressed with gzip if it ends with .gz)
+
+    Returns:
+        (numpy.ndarray) query_ids: query of each line
+        (numpy.ndarray) doc_ids: document of each line
+        (numpy.ndarray) scores: score of each line
+
+"""
+def read_run(path):
+    return read_columns(path,{0:np.int64,2:np.int64,4:np.float64})
+
+
+
+"""Reads qrels in the TREC format (query and document ids must be integers).
+
+    Args:
+        (str) path: path of the file (compressed with gzip if it ends with .gz)
+
+    Returns:
+        (numpy.ndarray) query_ids: query of each line
+        (numpy.ndarray) doc_ids: document of each line
+        (numpy.ndarray) rels: relevance level of each line
+
+"""
+def read_qrels(path):
+    return read_columns(path,{0:np.int64,2:np.int64,3:np.int64})
@@ -0,0 +1,85 @@
+import csv
+import json
+import concurrent.futures
+
+
+
+"""Size in bytes of the write buffer of output files"""
+BUFFER_SIZE = 2**22
+
+
+
+"""Opens an output file with a large write buffer.
+
+    Args:
+        (str) path: path of the file
+
+    Returns:
+        (file) f: file opened in text mode for writing
+
+"""
+def open_output(path):
+    return open(path,'w',buffering=BUFFER_SIZE,newline='')
+
+
+
+"""Writes lines produced on the fly, without building the content of the file in memory.
+
+    Args:
+        (str) path: path of the file
+        (iterable) lines: strings ending with a line break
+
+"""
+def write_lines(path,lines):
+    with open_output(path) as f:
+        f.writelines(lines)
+
+
+
+"""Writes rows produced on the fly in a csv file (same quoting and line breaks as pandas.DataFrame.to_csv).
+
+    Args:
+        (str) path: path of the file
+        (list) header: names of the columns
+        (iterable) rows: lists of values
+
+"""
+def write_csv(path,header,rows):
+    with open_output(path) as f:
+        writer = csv.writer(f,lineterminator='\n')
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+
+"""Writes (key,value) pairs produced on the fly as a json object (same output as json.dump of a dict).
+
+    Args:
+        (str) path: path of the file
+        (iterable) items: (key,value) pairs, keys are strings or integers and values are json serializable
+
+"""
+def write_json_object(path,items):
+    with open_output(path) as f:
+        f.write('{')
+        f.writelines((', ' if i else '') + json.dumps(str(key)) + ': ' + json.dumps(value)
+                     for i,(key,value) in enumerate(items))
+        f.write('}')
+
+
+
+"""Runs writing jobs at the same time, in threads (the files are written while other files are being formatted).
+
+    Args:
+        (list) jobs: tuples (function,arg1,arg2,...) of writing functions and their arguments
+
+"""
+def run_in_parallel(jobs):
+    if len(jobs) == 1:
+        function,*args = jobs[0]
+        function(*args)
+        return
+    with concurrent.futures.ThreadPoolExecutor(len(jobs)) as executor:
+        futures = [executor.submit(*job) for job in jobs]
+        for future in futures:
+            future.result()